@@ -0,0 +1,176 @@
+"""
+Questo modulo si occupa di misurare le prestazioni di xml_parser.py su
+report sintetici generati da report_generator.py.
+
+Per ogni dimensione del report e per ogni parametro di xml_parser.py
+(--results, --ports, --details, --all) vengono misurati il tempo di
+esecuzione, il picco di memoria residente (RSS) e i risultati elaborati
+al secondo. Le misure possono essere salvate come riferimento (baseline)
+e confrontate con quelle delle esecuzioni successive, per individuare
+eventuali regressioni.
+
+La baseline inclusa (Reports/benchmarks/baseline.json) è stata misurata
+con i parametri predefiniti su una macchina con una sola CPU: le misure
+dipendono dalla macchina, per cui va rigenerata con --save-baseline su
+quella utilizzata per i confronti.
+"""
+from argparse import ArgumentParser
+from json import load, dump
+from os import makedirs, wait4, waitstatus_to_exitcode
+from os.path import abspath, dirname, exists, join
+from subprocess import Popen, DEVNULL
+from sys import executable, exit
+from time import perf_counter
+from report_generator import generate_report
+
+XML_PARSER = join(dirname(abspath(__file__)), "xml_parser.py")
+DEFAULT_BASELINE = join(dirname(abspath(__file__)),
+                        "Reports", "benchmarks", "baseline.json")
+DEFAULT_WORK_DIR = join(dirname(abspath(__file__)),
+                        "Reports", "benchmarks", "work")
+
+
+def get_parser():
+    """
+    Crea e restituisce il parser dei parametri inseriti a linea di comando.
+    """
+    parser = ArgumentParser(
+        description='Benchmark xml_parser.py on synthetic OpenVAS reports.')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+        help='Comma separated numbers of results of the generated reports '
+             '(default: 1000,10000,100000)')
+    parser.add_argument('--hosts', type=int, default=16,
+        help='Number of hosts of the generated reports (default: 16)')
+    parser.add_argument('--flags', default='--results,--ports,--details,--all',
+        help='Comma separated xml_parser.py section flags to benchmark '
+             '(default: --results,--ports,--details,--all)')
+    parser.add_argument('--extra', default='',
+        help='Extra xml_parser.py arguments, passed as '
+             '--extra="--stream --incremental"')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='Runs per measure, the best one is kept (default: 3)')
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR,
+        help='Directory of the generated reports')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+        help='Baseline file')
+    parser.add_argument('--save-baseline', action='store_true',
+        help='Save the measures as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+        help='Allowed slowdown or memory growth over the baseline '
+             '(default: 0.2, i.e. 20%%)')
+    parser.add_argument('--output',
+        help='Also write the measures to this file')
+
+    return parser
+
+
+def get_report(work_dir, results, hosts) -> str:
+    """
+    Restituisce il nome del report sintetico con il numero di risultati e
+    di host richiesti, generandolo se non esiste già
+    """
+    makedirs(work_dir, exist_ok=True)
+    input_file = join(work_dir, f"synthetic_{hosts}h_{results}r.xml")
+    if not exists(input_file):
+        print(f"Generating {input_file}.")
+        generate_report(input_file, hosts=hosts, results=results,
+                        errors=max(results // 1000, 1))
+    return input_file
+
+
+def run_parser(input_file, arguments) -> tuple:
+    """
+    Esegue xml_parser.py in un processo separato e restituisce la coppia
+    (tempo di esecuzione in secondi, picco di memoria residente in KB)
+    """
+    start = perf_counter()
+    process = Popen([executable, XML_PARSER, "--no-cache",
+                     "--input", input_file, *arguments],
+                    stdout=DEVNULL, stderr=DEVNULL)
+    _, status, usage = wait4(process.pid, 0)
+    elapsed = perf_counter() - start
+    process.returncode = waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"xml_parser.py {' '.join(arguments)} failed "
+                           f"on {input_file}")
+    return elapsed, usage.ru_maxrss
+
+
+def run_benchmarks(sizes, hosts, flags, extra, repeat, work_dir) -> dict:
+    """
+    Esegue le misure e restituisce un dizionario contenente, per ogni
+    combinazione di dimensione e parametro, il tempo di esecuzione, il
+    picco di memoria e i risultati elaborati al secondo
+    """
+    measures = {}
+    for results in sizes:
+        input_file = get_report(work_dir, results, hosts)
+        for flag in flags:
+            arguments = [flag, *extra]
+            runs = [run_parser(input_file, arguments) for _ in range(repeat)]
+            elapsed = min(run[0] for run in runs)
+            rss = min(run[1] for run in runs)
+            key = f"{results}r {hosts}h {' '.join(arguments)}"
+            measures[key] = {"wall_time": round(elapsed, 4),
+                             "peak_rss_kb": rss,
+                             "results_per_sec": round(results / elapsed, 1)}
+            print(f"{key:<40}{elapsed:>9.3f}s{rss / 1024:>10.1f}MB"
+                  f"{results / elapsed:>12.0f} results/s")
+    return measures
+
+
+def compare_with_baseline(measures, baseline, tolerance) -> list:
+    """
+    Confronta le misure con quelle di riferimento e restituisce la lista
+    delle regressioni (tempo o memoria oltre la tolleranza)
+    """
+    regressions = []
+    for key, measure in measures.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        for field in ("wall_time", "peak_rss_kb"):
+            if measure[field] > reference[field] * (1 + tolerance):
+                regressions.append(f"{key}: {field} {reference[field]} -> "
+                                   f"{measure[field]}")
+    return regressions
+
+
+def main():
+    """
+    Main function.
+    """
+    args = get_parser().parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    flags = [flag for flag in args.flags.split(",") if flag]
+    extra = args.extra.split()
+
+    measures = run_benchmarks(sizes, args.hosts, flags, extra,
+                              args.repeat, args.work_dir)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            dump(measures, f, indent=4)
+
+    baseline = {}
+    if exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = load(f)
+
+    if args.save_baseline:
+        baseline.update(measures)
+        makedirs(dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            dump(baseline, f, indent=4)
+        print(f"Baseline saved to {args.baseline}.")
+        return
+
+    regressions = compare_with_baseline(measures, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
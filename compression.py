@@ -0,0 +1,54 @@
+"""
+Questo è un modulo di supporto per gli script xml_parser.py,
+cve_extractor.py e cve.py
+
+Permette di leggere e scrivere in modo trasparente file compressi con
+gzip (.gz) o xz (.xz): il formato è determinato dall'estensione del file
+e il contenuto viene (de)compresso man mano che viene letto o scritto,
+senza file temporanei.
+"""
+import gzip
+import lzma
+
+COMPRESSIONS = {"gz": gzip.open, "xz": lzma.open}
+
+
+def get_compression(file_name):
+    """
+    Restituisce il formato di compressione del file ("gz" o "xz")
+    in base alla sua estensione, None se il file non è compresso
+    """
+    extension = file_name.rsplit(".", 1)[-1].lower()
+    return extension if extension in COMPRESSIONS else None
+
+
+def strip_compression(file_name) -> str:
+    """
+    Restituisce il nome del file senza l'estensione di compressione
+    (ad esempio report.xml.gz -> report.xml)
+    """
+    if get_compression(file_name) is None:
+        return file_name
+    return file_name.rsplit(".", 1)[0]
+
+
+def get_compression_suffix(compression) -> str:
+    """
+    Restituisce l'estensione da aggiungere al nome dei file compressi
+    con il formato indicato ("" se compression è None)
+    """
+    return "" if compression is None else "." + compression
+
+
+def open_file(file_name, mode="r", compression=None):
+    """
+    Apre il file con la modalità indicata, come open. Se il formato di
+    compressione non è indicato viene determinato dall'estensione.
+    """
+    if compression is None:
+        compression = get_compression(file_name)
+    if compression is None:
+        return open(file_name, mode)
+    if "b" not in mode and "t" not in mode:
+        mode += "t"
+    return COMPRESSIONS[compression](file_name, mode)
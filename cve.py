@@ -6,9 +6,17 @@ import time
 from argparse import ArgumentParser
 import concurrent.futures
 import requests
-from multiprocessing import cpu_count
+from requests.adapters import HTTPAdapter
 import json
-from os.path import dirname, splitext
+from os.path import splitext
+from compression import COMPRESSIONS, get_compression_suffix, \
+    open_file, strip_compression
+
+# API del CIRCL per la richiesta riguardante le CVE
+CIRCL_URL = r"https://cve.circl.lu/api/cve/"
+
+# Numero predefinito di richieste contemporanee all'API
+DEFAULT_CONCURRENCY = 16
 
 
 def get_parser():
@@ -19,7 +27,14 @@ def get_parser():
         description='Request CVEs to CIRCL\'s API out of a '
                     '.cve-parsed file created by cve_extractor.py')
     parser.add_argument('--input', required=True,
-                        help='Input file')
+                        help='Input file, optionally compressed '
+                             '(.cve.gz, .cve.xz)')
+    parser.add_argument('--compress', choices=list(COMPRESSIONS),
+                        help='Compress the output file with gzip (gz) or xz')
+    parser.add_argument('--concurrency', type=int,
+                        default=DEFAULT_CONCURRENCY,
+                        help='Maximum number of concurrent requests '
+                             f'(default: {DEFAULT_CONCURRENCY})')
 
     return parser
 
@@ -38,32 +53,34 @@ def get_file_data(input_file):
     Line Feed ('\\n') oppure, su Windows, ('\\r\\n')
     """
     lst = list()
-    with open(input_file) as f:
+    with open_file(input_file) as f:
         for line in f.readlines():
             lst.append(line.replace('\n', ''))
     return lst
 
 
-def get_output_file_name(input_file, api_provider):
+def get_output_file_name(input_file, api_provider, compression=None):
     """
-    Computa e restituisce il nome del file di output
+    Computa e restituisce il nome del file di output, nella
+    stessa cartella del file di input e compresso se
+    compression non è None
     """
-    drnm = dirname(input_file)
-    return ("." if drnm == '' else drnm) + r"/" + \
-           splitext(input_file)[0] + "_" + api_provider + ".cve"
+    return splitext(strip_compression(input_file))[0] + "_" + \
+        api_provider + ".cve" + get_compression_suffix(compression)
 
 
-def process_cve(url, cve):
+def process_cve(url, cve, session=requests):
     """
     Esegui la richiesta all'API del CIRCL (url) riguardo la CVE
-    passata come parametro
+    passata come parametro, tramite la sessione indicata
+    (requests.Session) oppure in una nuova connessione
 
     Restituisce il dizionario corrispondente al json restituito
     in caso di successo, None altrimenti
     """
     try:
         # time.sleep(0.25)
-        return json.loads(requests.get(url + cve).text)
+        return json.loads(session.get(url + cve).text)
     except:
         return None
 
@@ -77,18 +94,20 @@ def generator(data):
         yield index, cve
 
 
-def main():
+def request_cves(data, url=CIRCL_URL, session=requests,
+                 max_in_flight=DEFAULT_CONCURRENCY) -> dict:
     """
-    Main function (Damn I'm really smart.)
-    """
-    # Acquisizione del parametro riguardante il file di input e
-    # il relativo contenuto
-    input_file = get_input_file(get_parser())
-    data = get_file_data(input_file)
+    Esegue in parallelo le richieste all'API (url) per ogni CVE della
+    lista passata come parametro, tramite la sessione indicata.
 
-    # API del CIRCL per la richiesta riguardante le CVE
-    url = r"https://cve.circl.lu/api/cve/"
+    Le richieste in corso sono al massimo max_in_flight: non appena una
+    termina ne viene avviata una nuova, per cui una risposta lenta non
+    blocca le altre. I risultati vengono raccolti nell'ordine in cui le
+    richieste terminano.
 
+    Restituisce il dizionario contenente, per ogni CVE trovata,
+    le relative informazioni, nell'ordine della lista
+    """
     # Dizionario che conterrà le informazioni relative alle CVE
     out = {}
 
@@ -96,54 +115,98 @@ def main():
     length = len(data)
     pad = len(str(length))
 
-    # Parametri per la gestione della componente parallela del programma
-    max_threads = cpu_count()
-    threads = {}
-    threads_num = 0
-
-    # Crea una ThreadPoolExecutor
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-
-        # Per ogni indice e CVE contenuta nel file di input
-        for index, cve in generator(data):
-            try:
-                # Se abbiamo raggiunto il massimo di thread
-                # eseguibili in parallelo
-                if threads_num == max_threads:
-
-                    # Per ognuno di essi filtra attendi il completamento
-                    # ed ottieni il risultato della computazione
-                    for t_cve, thread in threads.items():
-                        r = thread.result()
-                        # Effettua controlli sul risultato ed aggiungilo
-                        # al dizionario contenente le informazioni
-                        if r is not None:
-                            out[t_cve] = r
-                        else:
-                            print(f"Not found: {url + t_cve}")
-
-                    # Pulisci la lista contenente i thread
-                    # e resetta il contatore
-                    threads.clear()
-                    threads_num = 0
-
-                # Comunica a schermo le CVE che è attualmente processata
+    # Richieste in corso, con la relativa CVE
+    pending = {}
+    cves = generator(data)
+
+    # Crea una ThreadPoolExecutor con un thread per ogni richiesta
+    # contemporanea: il lavoro è limitato dalla rete, non dalla CPU
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_in_flight) as executor:
+        while True:
+            # Riempi la finestra delle richieste in corso
+            for index, cve in cves:
+                # Comunica a schermo la CVE che è attualmente processata
                 print(f"Processing: {cve:<14} ({index:<{pad}}/{length})")
+                pending[executor.submit(process_cve, url, cve,
+                                        session)] = cve
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+
+            # Attendi il completamento di almeno una richiesta
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                cve = pending.pop(future)
+                try:
+                    r = future.result()
+                except Exception:
+                    # Se ci sono errori, comunicali e salta la CVE
+                    print(f"Generic error processing: {url + cve}")
+                    continue
+                # Effettua controlli sul risultato ed aggiungilo
+                # al dizionario contenente le informazioni
+                if r is not None:
+                    out[cve] = r
+                else:
+                    print(f"Not found: {url + cve}")
+
+    return {cve: out[cve] for cve in data if cve in out}
+
+
+def create_session(max_in_flight=DEFAULT_CONCURRENCY):
+    """
+    Crea e restituisce una sessione HTTP (requests.Session) che mantiene
+    aperta una connessione per ogni richiesta contemporanea: il pool
+    predefinito di requests ne mantiene al massimo 10 per host e chiude
+    quelle in più al termine di ogni richiesta
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max_in_flight)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def enrich(cves, url=CIRCL_URL, session=None,
+           max_in_flight=DEFAULT_CONCURRENCY) -> dict:
+    """
+    Restituisce il dizionario contenente, per ogni CVE della lista
+    trovata dall'API (url), le relative informazioni.
+
+    Se session (requests.Session, si veda create_session) non è None le
+    connessioni vengono riutilizzate tra chiamate successive, ad esempio
+    da un servizio che elabora più report; altrimenti viene creata una
+    sessione per la singola chiamata.
+    """
+    if session is not None:
+        return request_cves(cves, url, session, max_in_flight)
+    with create_session(max_in_flight) as session:
+        return request_cves(cves, url, session, max_in_flight)
+
+
+def main():
+    """
+    Main function (Damn I'm really smart.)
+    """
+    # Acquisizione del parametro riguardante il file di input e
+    # il relativo contenuto
+    parser = get_parser()
+    args = vars(parser.parse_args())
+    if args["concurrency"] < 1:
+        parser.error("--concurrency must be at least 1")
+    input_file = args["input"]
+    data = get_file_data(input_file)
 
-                # Crea un thread per processare la CVE e
-                # aggiungilo alla lista dei threads già
-                # esistenti, incrementando il contatore.
-                threads[cve] = executor.submit(process_cve, url, cve)
-                threads_num += 1
-            except:
-                # Se ci sono errori, comunicali e salta il
-                # processing dell'attuale CVE
-                print(f"Generic error processing: {url + cve}")
-                continue
+    # Richiesta delle informazioni relative alle CVE all'API del CIRCL
+    out = enrich(data, max_in_flight=args["concurrency"])
 
     # Apri il file di output e scrivi il dizionario contenente
     # le informazioni relative alle CVE processate
-    with open(get_output_file_name(input_file, "circl"), "w") as f:
+    with open_file(get_output_file_name(input_file, "circl",
+                                        args["compress"]), "w") as f:
         f.write(json.dumps(out, indent=4))
 
 
@@ -2,10 +2,35 @@
 Questo modulo si occupa di estrarre, dal file generato
 dal modulo xml-parser.py, i campi relativi alle
 CVE (Common Vulnerabilities and Exposures).
+
+Le CVE possono essere estratte anche direttamente dal report (XML) di
+OpenVAS: il file viene letto in modalità streaming, senza creare il
+report in formato json, e le CVE vengono scritte man mano che vengono
+trovate.
+
+Anche il report in formato json viene letto in modo incrementale (si veda
+result_tables.iter_report_results): i risultati vengono decodificati
+uno alla volta e scartati dopo averne letto il campo nvt.cve, per cui la
+memoria occupata non cresce con la dimensione del report.
+
+Con --index-db il report viene invece aggiunto all'indice inverso delle
+CVE (si veda cve_index), che può poi essere consultato con --lookup.
+
+Con --set le CVE vengono scritte come insieme in formato binario (si veda
+cve_set), e con --compare due insiemi vengono confrontati per ottenere le
+CVE nuove e quelle risolte.
 """
-from json import load
 from argparse import ArgumentParser
-from os.path import dirname, splitext
+from json import dumps
+from sys import exit, stderr
+from os.path import splitext
+from compression import COMPRESSIONS, get_compression_suffix, \
+    open_file, strip_compression
+from result_tables import iter_report_results, load_report, \
+    NVTS_SECTION
+from xml_backend import BACKENDS, get_backend
+from cve_index import CveIndex, is_xml_report
+from cve_set import CveSet, cve_to_int
 
 
 def get_parser():
@@ -16,7 +41,32 @@ def get_parser():
     parser = ArgumentParser(
         description='Filter CVEs out of a JSON-parsed'
                     'XML report created by OpenVAS.')
-    parser.add_argument('--input', required=True, help='Input file')
+    parser.add_argument('--input',
+                        help='Input file: a JSON report created by '
+                             'xml_parser.py or an OpenVAS XML report, '
+                             'optionally compressed (.gz, .xz)')
+    parser.add_argument('--backend', choices=BACKENDS, default='auto',
+                        help='XML library used to read XML reports: lxml '
+                             'if installed (auto), lxml or the standard '
+                             'library (etree)')
+    parser.add_argument('--compress', choices=list(COMPRESSIONS),
+                        help='Compress the output file with gzip (gz) or xz')
+    parser.add_argument('--index-db',
+                        help='Add the input report to this persistent CVE '
+                             'index (SQLite) instead of writing the CVE list')
+    parser.add_argument('--lookup', nargs='+', metavar='CVE',
+                        help='Print the reports, hosts and ports where the '
+                             'CVEs were found (requires --index-db)')
+    parser.add_argument('--exposed', action='store_true',
+                        help='With --lookup, only print the hosts whose '
+                             'latest report still contains the CVE')
+    parser.add_argument('--set', action='store_true',
+                        help='Write the CVEs as a binary CVE set (.cveset) '
+                             'instead of a text list')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='Print the CVEs that are new and fixed in NEW '
+                             'with respect to OLD (.cveset files or .cve '
+                             'lists)')
 
     return parser
 
@@ -30,11 +80,36 @@ def get_input_file(parser):
 
 def get_file_data(input_file):
     """
-    Legge il file json in input e ne restituisce
-    il dizionario corrispondente
+    Legge il file json in input, eventualmente compresso,
+    e ne restituisce il dizionario corrispondente, con
+    nvt e descrizioni all'interno dei risultati
     """
-    with open(input_file) as json_file:
-        return load(json_file)
+    return load_report(input_file)
+
+
+def iter_unique_cves(cve_fields):
+    """
+    Generatore che restituisce, nell'ordine in cui vengono incontrate e
+    una sola volta, le CVE contenute nei campi cve degli nvt passati come
+    parametro (CVE separate da virgole, "NOCVE" o None se assenti)
+    """
+    already_seen = set()
+
+    for cve in cve_fields:
+
+        # Se il campo non è vuoto
+        if cve is None or cve == "NOCVE":
+            continue
+
+        # Separa tutte le CVE in una lista, senza spazi
+        for x in cve.split(','):
+            x = "".join(x.split())
+
+            # E se non l'abbiamo già incontrata prima
+            if x and x not in already_seen:
+                # Restituisci la CVE
+                already_seen.add(x)
+                yield x
 
 
 def get_cve(results):
@@ -44,39 +119,134 @@ def get_cve(results):
 
         Restituisce poi una lista dei campi filtrati.
     """
-    already_seen = set()
-    cves = list()
+    # Per ogni host presente nel nodo results (XML), estrai il campo
+    # relativo alle CVE di ogni risultato
+    return list(iter_unique_cves(d['nvt']['cve']
+                                 for elements in results.values()
+                                 for d in elements))
+
+
+def iter_json_cve_fields(input_file):
+    """
+    Generatore che restituisce il campo cve dell'nvt di ogni risultato
+    del report in formato json (eventualmente compresso), leggendolo in
+    modo incrementale (si veda result_tables.iter_report_results): ogni
+    risultato viene scartato dopo averne letto il campo e le altre
+    sezioni vengono saltate senza essere costruite.
+
+    Se i risultati fanno riferimento alla tabella degli nvt, le chiavi
+    distinte vengono conservate, nell'ordine in cui sono incontrate, fino
+    alla lettura della tabella.
+    """
+    sections = {}
+    pending = {}
+    for _, _, nvt in iter_report_results(input_file, sections):
+        if isinstance(nvt, dict):
+            yield nvt.get("cve")
+        else:
+            pending[nvt] = None
+    nvts = sections.get(NVTS_SECTION, {})
+    for key in pending:
+        yield nvts.get(key, {}).get("cve")
+
+
+def iter_xml_cves(input_file, backend=None):
+    """
+    Generatore che restituisce, una sola volta, le CVE dei risultati del
+    report (XML) di OpenVAS, eventualmente compresso, leggendolo in
+    modalità streaming (si veda xml_backend.stream_results): di ogni
+    nodo result viene letto soltanto il campo nvt/cve, e il nodo viene
+    poi scartato, per cui la memoria occupata non cresce con il numero
+    dei risultati.
+    """
+    backend = get_backend(backend)
+    with open_file(input_file, "rb") as f:
+        _, result_nodes = backend.stream_results(f)
+        yield from iter_unique_cves(result.findtext("nvt/cve")
+                                    for result in result_nodes)
+
+
+def extract_cves(report) -> list:
+    """
+    Restituisce la lista delle CVE contenute nei risultati del report
+    in formato json (ad esempio restituito da get_file_data oppure da
+    xml_parser.parse_report), vuota se il report non contiene i risultati
+    """
+    return get_cve(report.get("results", {}))
+
+
+def index_report(index_file, input_file, backend=None) -> bool:
+    """
+    Aggiunge il report (XML o json) all'indice inverso delle CVE
+    memorizzato in index_file (si veda cve_index.CveIndex.add_report).
+
+    Restituisce False se il report era già indicizzato e non è stato
+    modificato, True altrimenti.
+    """
+    index = CveIndex(index_file)
+    try:
+        return index.add_report(input_file, backend)
+    finally:
+        index.close()
+
 
-    for host in [k for k, _ in results.items()]:
+def lookup_cves(index_file, cves, exposed=False) -> dict:
+    """
+    Restituisce un dizionario contenente, per ogni CVE della lista, le
+    relative occorrenze nell'indice memorizzato in index_file (si veda
+    cve_index.CveIndex.lookup)
+    """
+    index = CveIndex(index_file)
+    try:
+        return {cve: index.lookup(cve, exposed) for cve in cves}
+    finally:
+        index.close()
 
-        # Per ogni host presente nel nodo results (XML):
-        for d in results[host]:
 
-            # Estrai il dizionario relativo alle CVE
-            cve = d['nvt']['cve']
+def get_cve_set(cves) -> CveSet:
+    """
+    Restituisce l'insieme (si veda cve_set.CveSet) delle CVE della lista;
+    gli identificativi che non sono CVE vengono segnalati e scartati
+    """
+    values = []
+    for cve in cves:
+        try:
+            values.append(cve_to_int(cve))
+        except ValueError:
+            print(f"Skipping invalid CVE: {cve}", file=stderr)
+    return CveSet(values)
 
-            # E se non è vuoto
-            if cve != "NOCVE":
 
-                # Separa tutte le CVE in una lista
-                for x in cve.split(','):
+def load_cve_set(input_file) -> CveSet:
+    """
+    Legge l'insieme delle CVE da un file in formato binario (.cveset)
+    oppure da una lista di CVE (.cve), eventualmente compressi
+    """
+    if strip_compression(input_file).endswith(".cveset"):
+        return CveSet.load(input_file)
+    with open_file(input_file) as f:
+        return get_cve_set(line.strip() for line in f if line.strip())
 
-                    # E se non l'abbiamo già incontrata prima
-                    if x not in already_seen:
-                        # Aggiungila alla lista delle CVE da restituire
-                        already_seen.add(x)
-                        cves.append(x.replace(' ', ''))
 
-    return cves
+def compare_cve_sets(old, new) -> dict:
+    """
+    Confronta due insiemi di CVE (ad esempio di due scansioni successive)
+    e restituisce le CVE nuove, quelle risolte e il numero di quelle
+    invariate
+    """
+    return {"new": list(new - old),
+            "fixed": list(old - new),
+            "unchanged": len(old & new)}
 
 
-def get_output_file_name(input_file):
+def get_output_file_name(input_file, compression=None, extension=".cve"):
     """
-    Computa e restituisce il nome del file di output
+    Computa e restituisce il nome del file di output, nella
+    stessa cartella del file di input e compresso se
+    compression non è None
     """
-    drnm = dirname(input_file)
-    return ("." if drnm == '' else drnm) + r"/" \
-           + splitext(input_file)[0] + ".cve"
+    return splitext(strip_compression(input_file))[0] + extension \
+        + get_compression_suffix(compression)
 
 
 def write_list_to_file(output_file, lst):
@@ -84,7 +254,7 @@ def write_list_to_file(output_file, lst):
     Scrive nel file di output output_file la 
     lista passata come parametro
     """
-    with open(output_file, "w") as out:
+    with open_file(output_file, "w") as out:
         for s in lst:
             out.write(s + '\n')
 
@@ -93,10 +263,46 @@ def main():
     """
     Main function. (Oh, really?)
     """
-    input_file = get_input_file(get_parser())
-    data = get_file_data(input_file)
-    cves = get_cve(data["results"])
-    write_list_to_file(get_output_file_name(input_file), cves)
+    parser = get_parser()
+    args = vars(parser.parse_args())
+    input_file = args["input"]
+    if args["lookup"] and not args["index_db"]:
+        parser.error("--lookup requires --index-db")
+    if input_file is None and not args["lookup"] and not args["compare"]:
+        parser.error("--input is required unless --lookup or --compare "
+                     "is used")
+
+    if args["compare"]:
+        print(dumps(compare_cve_sets(*map(load_cve_set, args["compare"])),
+                    indent=4))
+        return
+
+    if args["index_db"]:
+        if input_file is not None:
+            try:
+                indexed = index_report(args["index_db"], input_file,
+                                       args["backend"])
+            except ValueError as e:
+                exit(f"Unable to index {input_file}: {e}")
+            if indexed:
+                print(f"Indexed {input_file}.")
+            else:
+                print(f"{input_file} is already indexed.")
+        if args["lookup"]:
+            print(dumps(lookup_cves(args["index_db"], args["lookup"],
+                                    args["exposed"]), indent=4))
+        return
+
+    if is_xml_report(input_file):
+        cves = iter_xml_cves(input_file, args["backend"])
+    else:
+        cves = iter_unique_cves(iter_json_cve_fields(input_file))
+    if args["set"]:
+        get_cve_set(cves).save(get_output_file_name(
+            input_file, args["compress"], ".cveset"))
+        return
+    write_list_to_file(get_output_file_name(input_file, args["compress"]),
+                       cves)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,298 @@
+"""
+Questo è un modulo di supporto per lo script cve_extractor.py
+
+Contiene l'indice inverso delle CVE: un database SQLite persistente che
+associa ad ogni CVE le relative occorrenze (report, host, porta, oid
+dell'nvt, gravità) in tutti i report indicizzati.
+
+L'indice viene aggiornato in modo incrementale: ogni report viene
+aggiunto (o sostituito, se già presente) senza rielaborare gli altri,
+e i report non modificati dall'ultima indicizzazione vengono ignorati.
+Per ogni report vengono memorizzati anche la data e gli host
+scansionati, così da sapere quali host sono ancora esposti ad una CVE,
+cioè la contengono nel report più recente che li riguarda.
+"""
+import sqlite3
+from datetime import datetime
+from os import stat
+from os.path import abspath, basename
+from compression import open_file, strip_compression
+from cve_set import cve_to_int, int_to_cve
+from result_tables import iter_report_results, NVTS_SECTION
+from xml_backend import get_backend
+
+OCCURRENCE_COLUMNS = ("cve", "report_id", "host", "port", "nvt_oid",
+                      "severity")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS reports (report_id TEXT PRIMARY KEY, "
+    "task_id TEXT, timestamp TEXT, source TEXT, signature TEXT)",
+    "CREATE TABLE IF NOT EXISTS report_hosts (report_id TEXT, host TEXT)",
+    "CREATE TABLE IF NOT EXISTS occurrences (cve TEXT, report_id TEXT, "
+    "host TEXT, port TEXT, nvt_oid TEXT, severity REAL)",
+    "CREATE INDEX IF NOT EXISTS reports_source ON reports (source)",
+    "CREATE INDEX IF NOT EXISTS report_hosts_host ON report_hosts (host)",
+    "CREATE INDEX IF NOT EXISTS report_hosts_report "
+    "ON report_hosts (report_id)",
+    "CREATE INDEX IF NOT EXISTS occurrences_cve ON occurrences (cve)",
+    "CREATE INDEX IF NOT EXISTS occurrences_report "
+    "ON occurrences (report_id)",
+)
+
+# Occorrenze della CVE nel report più recente di ogni host
+EXPOSED_QUERY = (
+    "SELECT o.cve, o.report_id, o.host, o.port, o.nvt_oid, o.severity "
+    "FROM occurrences o JOIN reports r ON r.report_id = o.report_id "
+    "WHERE o.cve = ? AND COALESCE(r.timestamp, '') = ("
+    "SELECT MAX(COALESCE(r2.timestamp, '')) FROM report_hosts h "
+    "JOIN reports r2 ON r2.report_id = h.report_id WHERE h.host = o.host)"
+)
+
+
+def normalize_cve(cve) -> str:
+    """
+    Restituisce la CVE in forma normalizzata (si veda cve_set.int_to_cve),
+    così che ad esempio "cve-2019-1234" e " CVE-2019-1234" coincidano;
+    gli identificativi che non sono CVE vengono restituiti senza spazi
+    """
+    try:
+        return int_to_cve(cve_to_int(cve))
+    except ValueError:
+        return "".join(cve.split())
+
+
+def split_cves(field) -> list:
+    """
+    Restituisce la lista delle CVE, normalizzate, contenute nel campo cve
+    di un nvt (CVE separate da virgole, "NOCVE" o None se assenti)
+    """
+    if field is None or field == "NOCVE":
+        return []
+    return [normalize_cve(x) for x in field.split(',') if x.strip()]
+
+
+def is_xml_report(input_file) -> bool:
+    """
+    Restituisce True se il file di input è un report (XML) di OpenVAS,
+    eventualmente compresso, invece di un report in formato json
+    """
+    return strip_compression(input_file).lower().endswith(".xml")
+
+
+def parse_severity(text):
+    """
+    Converte la gravità in float; restituisce None se il testo è vuoto o
+    non è un numero
+    """
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_timestamp(text):
+    """
+    Converte la data del report in formato json creato da xml_parser.py
+    (ad esempio "2020-08-30 15:40:10 Coordinated Universal Time (UTC)")
+    nel formato del report (XML), così che le date dei due formati siano
+    confrontabili; restituisce il testo invariato se non è in tale formato
+    """
+    try:
+        return datetime.strptime(text[:19], "%Y-%m-%d %H:%M:%S") \
+            .strftime("%Y-%m-%dT%H:%M:%SZ")
+    except (TypeError, ValueError):
+        return text
+
+
+def read_xml_report(input_file, backend=None):
+    """
+    Legge in modalità streaming il report (XML) di OpenVAS, eventualmente
+    compresso, e restituisce la tripla formata dal dizionario delle
+    informazioni sul report (report_id, task_id, timestamp), dall'insieme
+    degli host scansionati e dalla lista delle occorrenze delle CVE
+    (host, porta, oid dell'nvt, gravità, CVE)
+    """
+    backend = get_backend(backend)
+    hosts = set()
+    rows = []
+    with open_file(input_file, "rb") as f:
+        context, result_nodes = backend.stream_results(f)
+        for result in result_nodes:
+            host = result.findtext("host")
+            hosts.add(host)
+            nvt = result.find("nvt")
+            if nvt is None:
+                continue
+            for cve in split_cves(nvt.findtext("cve")):
+                rows.append((host, result.findtext("port"),
+                             nvt.attrib.get("oid"),
+                             parse_severity(result.findtext("severity")),
+                             cve))
+
+    # Il nodo radice è il report generico oppure la risposta
+    # get_reports che lo contiene
+    root = context.root
+    general_report = root if root.tag == "report" else root.find("report")
+    report = general_report.find("report")
+    if report is None:
+        report = general_report
+    task = report.find("task")
+    hosts.update(node.findtext("ip") for node in report.findall("host"))
+    info = {"report_id": general_report.attrib.get("id"),
+            "task_id": None if task is None else task.attrib.get("id"),
+            "timestamp": report.findtext("timestamp")}
+    return info, hosts, rows
+
+
+def read_json_report(input_file):
+    """
+    Legge il report in formato json creato da xml_parser.py, eventualmente
+    compresso, e restituisce la stessa tripla di read_xml_report; il
+    report in formato json non contiene l'oid degli nvt, per cui è None.
+
+    Il report viene letto in modo incrementale (si veda
+    result_tables.iter_report_results): ogni risultato viene scartato dopo
+    averne letto i campi. Se i risultati fanno riferimento alla tabella
+    degli nvt, le occorrenze vengono completate con le CVE al termine
+    della lettura.
+
+    Il report viene identificato dalla sezione scan (id del report, data e
+    host scansionati), presente nei report creati con --scan. Se manca,
+    come nei report creati in precedenza, l'id del report viene composto
+    dall'id del task (o dal nome del file) e dalla data, così che le
+    scansioni dello stesso task restino distinte, e gli host scansionati
+    sono quelli dei risultati e degli asset.
+    """
+    sections = dict.fromkeys(("scan", "task", "timestamp", "assets"))
+    hosts = set()
+    rows = []
+    pending = []
+    for host, element, nvt in iter_report_results(input_file, sections):
+        hosts.add(host)
+        row = (host, element["port"], None,
+               parse_severity(element["severity"]))
+        if isinstance(nvt, dict):
+            rows.extend(row + (cve,) for cve in split_cves(nvt.get("cve")))
+        else:
+            pending.append((row, nvt))
+
+    nvts = sections.get(NVTS_SECTION, {})
+    for row, key in pending:
+        rows.extend(row + (cve,) for cve
+                    in split_cves(nvts.get(key, {}).get("cve")))
+    scan = sections["scan"]
+    if scan is not None:
+        hosts.update(scan["hosts"])
+        info = {"report_id": scan["report_id"],
+                "task_id": scan["task_id"],
+                "timestamp": scan["timestamp"]}
+        return info, hosts, rows
+
+    hosts.update(sections["assets"] or ())
+    task_id = (sections["task"] or {}).get("id")
+    timestamp = normalize_timestamp(sections["timestamp"])
+    stem = basename(strip_compression(input_file)).rsplit(".", 1)[0]
+    report_id = task_id or stem
+    if timestamp is not None:
+        report_id = f"{report_id}@{timestamp}"
+    info = {"report_id": report_id,
+            "task_id": task_id,
+            "timestamp": timestamp}
+    return info, hosts, rows
+
+
+class CveIndex:
+    """
+    Indice inverso delle CVE, memorizzato nel database SQLite indicato.
+    Più processi possono aggiornarlo contemporaneamente: ogni report
+    viene aggiunto in un'unica transazione.
+    """
+
+    def __init__(self, path, timeout=30):
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def is_indexed(self, source, signature) -> bool:
+        """
+        Restituisce True se il file è già stato indicizzato e non è stato
+        modificato da allora
+        """
+        return self.connection.execute(
+            "SELECT 1 FROM reports WHERE source = ? AND signature = ?",
+            (source, signature)).fetchone() is not None
+
+    def has_xml_source(self, report_id) -> bool:
+        """
+        Restituisce True se il report è stato indicizzato dal report (XML)
+        """
+        row = self.connection.execute(
+            "SELECT source FROM reports WHERE report_id = ?",
+            (report_id,)).fetchone()
+        return row is not None and is_xml_report(row[0])
+
+    def add_report(self, input_file, backend=None) -> bool:
+        """
+        Aggiunge all'indice il report (XML o json, eventualmente
+        compresso), sostituendo le occorrenze di un'eventuale
+        indicizzazione precedente dello stesso report. Un report in
+        formato json non sostituisce lo stesso report già indicizzato dal
+        report (XML), che contiene anche l'oid degli nvt.
+
+        Restituisce False se il report era già indicizzato e non è stato
+        modificato (o è già indicizzato dal report XML), True altrimenti.
+        """
+        source = abspath(input_file)
+        st = stat(source)
+        signature = f"{st.st_size}:{st.st_mtime_ns}"
+        if self.is_indexed(source, signature):
+            return False
+
+        if is_xml_report(input_file):
+            info, hosts, rows = read_xml_report(input_file, backend)
+        else:
+            info, hosts, rows = read_json_report(input_file)
+            if self.has_xml_source(info["report_id"]):
+                return False
+        report_id = info["report_id"]
+
+        with self.connection:
+            for table in ("occurrences", "report_hosts", "reports"):
+                self.connection.execute(
+                    f"DELETE FROM {table} WHERE report_id = ?", (report_id,))
+            self.connection.execute(
+                "INSERT INTO reports VALUES (?, ?, ?, ?, ?)",
+                (report_id, info["task_id"], info["timestamp"], source,
+                 signature))
+            self.connection.executemany(
+                "INSERT INTO report_hosts VALUES (?, ?)",
+                ((report_id, host) for host in hosts if host is not None))
+            self.connection.executemany(
+                "INSERT INTO occurrences VALUES (?, ?, ?, ?, ?, ?)",
+                ((cve, report_id, host, port, oid, severity)
+                 for host, port, oid, severity, cve in rows))
+        return True
+
+    def lookup(self, cve, exposed=False) -> list:
+        """
+        Restituisce la lista delle occorrenze della CVE (normalizzata, si
+        veda normalize_cve), come dizionari
+        con chiavi OCCURRENCE_COLUMNS. Se exposed è True vengono
+        restituite soltanto le occorrenze nel report più recente di ogni
+        host, cioè gli host ancora esposti alla CVE.
+        """
+        cve = normalize_cve(cve)
+        if exposed:
+            cursor = self.connection.execute(EXPOSED_QUERY, (cve,))
+        else:
+            cursor = self.connection.execute(
+                "SELECT cve, report_id, host, port, nvt_oid, severity "
+                "FROM occurrences WHERE cve = ?", (cve,))
+        return [dict(zip(OCCURRENCE_COLUMNS, row)) for row in cursor]
+
+    def close(self):
+        """
+        Chiude la connessione al database
+        """
+        self.connection.close()
@@ -0,0 +1,226 @@
+"""
+Questo è un modulo di supporto per lo script cve_extractor.py
+
+Contiene la rappresentazione compatta delle CVE: ogni CVE viene
+normalizzata e codificata in un intero (anno nei 32 bit alti, numero di
+sequenza nei 32 bit bassi), per cui l'ordinamento degli interi coincide
+con quello per anno e numero.
+
+CveSet è un insieme di CVE memorizzato come array ordinato di interi:
+unione, intersezione e differenza (ad esempio le CVE nuove o risolte
+rispetto alla scansione precedente) vengono calcolate con NumPy, se
+installato, oppure con una fusione lineare dei due array. Gli insiemi
+possono essere salvati in un formato binario compatto (si veda save).
+"""
+from array import array
+from bisect import bisect_left
+from re import compile, IGNORECASE
+from struct import Struct
+from sys import byteorder
+from compression import open_file
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CVE_PATTERN = compile(r"CVE-(\d{4})-(\d+)", IGNORECASE)
+
+# Intestazione del formato binario: identificativo, versione e numero
+# di CVE, seguiti dagli interi (64 bit, little endian) in ordine crescente
+MAGIC = b"CVES"
+VERSION = 1
+HEADER = Struct("<4sII")
+
+
+def cve_to_int(cve) -> int:
+    """
+    Normalizza la CVE (spazi e maiuscole) e restituisce il relativo intero.
+    Solleva ValueError se il testo non è una CVE.
+    """
+    match = CVE_PATTERN.fullmatch("".join(cve.split()))
+    if match is None:
+        raise ValueError(f"Invalid CVE: {cve!r}")
+    sequence = int(match.group(2))
+    if sequence >= 1 << 32:
+        raise ValueError(f"Invalid CVE: {cve!r}")
+    return int(match.group(1)) << 32 | sequence
+
+
+def int_to_cve(value) -> str:
+    """
+    Restituisce la CVE, in forma normalizzata (anno di 4 cifre e numero
+    di sequenza di almeno 4 cifre), corrispondente all'intero
+    """
+    return f"CVE-{value >> 32:04d}-{value & 0xFFFFFFFF:04d}"
+
+
+def merge(a, b, operation):
+    """
+    Generatore che fonde due sequenze ordinate e senza ripetizioni,
+    restituendo gli elementi dell'unione ("union"), dell'intersezione
+    ("intersection") o della differenza ("difference") in ordine crescente
+    """
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] < b[j]:
+            if operation != "intersection":
+                yield a[i]
+            i += 1
+        elif a[i] > b[j]:
+            if operation == "union":
+                yield b[j]
+            j += 1
+        else:
+            if operation != "difference":
+                yield a[i]
+            i += 1
+            j += 1
+    if operation != "intersection":
+        yield from a[i:]
+    if operation == "union":
+        yield from b[j:]
+
+
+def sorted_unique(values):
+    """
+    Restituisce l'array NumPy ordinato e senza ripetizioni dei valori
+    (ordinamento e confronto tra elementi adiacenti, più veloce di
+    numpy.unique sugli interi)
+    """
+    values = np.sort(values)
+    if values.size:
+        keep = np.empty(values.size, dtype=bool)
+        keep[0] = True
+        np.not_equal(values[1:], values[:-1], out=keep[1:])
+        values = values[keep]
+    return values
+
+
+def to_array(values) -> array:
+    """
+    Converte un array NumPy di interi in un array di interi a 64 bit
+    """
+    return array("q", values.astype(np.int64).tobytes())
+
+
+class CveSet:
+    """
+    Insieme di CVE, memorizzato come array ordinato e senza ripetizioni
+    degli interi corrispondenti (si veda cve_to_int)
+    """
+    __slots__ = ("values",)
+
+    def __init__(self, cves=()):
+        self.values = array("q", sorted({
+            cve if isinstance(cve, int) else cve_to_int(cve)
+            for cve in cves}))
+
+    @classmethod
+    def from_sorted(cls, values):
+        """
+        Crea l'insieme a partire da interi già ordinati e senza ripetizioni
+        """
+        cve_set = cls.__new__(cls)
+        cve_set.values = values if isinstance(values, array) \
+            else array("q", values)
+        return cve_set
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return map(int_to_cve, self.values)
+
+    def __contains__(self, cve):
+        value = cve if isinstance(cve, int) else cve_to_int(cve)
+        index = bisect_left(self.values, value)
+        return index < len(self.values) and self.values[index] == value
+
+    def __eq__(self, other):
+        if not isinstance(other, CveSet):
+            return NotImplemented
+        return self.values == other.values
+
+    def __repr__(self):
+        return f"CveSet({list(self)!r})"
+
+    def combine(self, other, operation):
+        """
+        Restituisce l'insieme risultato dell'operazione ("union",
+        "intersection" o "difference") tra questo insieme e other
+        """
+        if np is None:
+            return CveSet.from_sorted(merge(self.values, other.values,
+                                            operation))
+        a = np.frombuffer(self.values, dtype=np.int64)
+        b = np.frombuffer(other.values, dtype=np.int64)
+        if operation == "union":
+            values = sorted_unique(np.concatenate((a, b)))
+        elif operation == "intersection":
+            values = a[np.isin(a, b, assume_unique=True)]
+        else:
+            values = a[np.isin(a, b, assume_unique=True, invert=True)]
+        return CveSet.from_sorted(to_array(values))
+
+    def union(self, other):
+        return self.combine(other, "union")
+
+    def intersection(self, other):
+        return self.combine(other, "intersection")
+
+    def difference(self, other):
+        return self.combine(other, "difference")
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    @classmethod
+    def union_all(cls, cve_sets):
+        """
+        Restituisce l'unione di tutti gli insiemi passati come parametro
+        (ad esempio le CVE di migliaia di report), calcolata in un'unica
+        operazione invece che a coppie
+        """
+        cve_sets = list(cve_sets)
+        if np is None:
+            return cls(value for cve_set in cve_sets
+                       for value in cve_set.values)
+        if not cve_sets:
+            return cls()
+        values = sorted_unique(np.concatenate(
+            [np.frombuffer(cve_set.values, dtype=np.int64)
+             for cve_set in cve_sets]))
+        return cls.from_sorted(to_array(values))
+
+    def save(self, output_file):
+        """
+        Scrive l'insieme nel file, nel formato binario, eventualmente
+        compresso in base all'estensione (si veda compression)
+        """
+        values = self.values
+        if byteorder == "big":
+            values = array("q", values)
+            values.byteswap()
+        with open_file(output_file, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(values)))
+            f.write(values.tobytes())
+
+    @classmethod
+    def load(cls, input_file):
+        """
+        Legge e restituisce l'insieme dal file in formato binario,
+        eventualmente compresso
+        """
+        with open_file(input_file, "rb") as f:
+            magic, version, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{input_file} is not a CVE set file")
+            values = array("q")
+            values.frombytes(f.read(count * values.itemsize))
+        if len(values) != count:
+            raise ValueError(f"{input_file} is truncated")
+        if byteorder == "big":
+            values.byteswap()
+        return cls.from_sorted(values)
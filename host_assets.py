@@ -0,0 +1,86 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Crea, a partire dai nodi host (XML) del report, l'indice degli asset di
+ogni host, consultabile tramite l'indirizzo IP dell'host:
+- os: sistemi operativi rilevati (cpe e descrizioni, migliore stima);
+- apps: applicazioni rilevate (cpe) e relative porte o percorsi;
+- ssl_certs: certificati rilevati (impronta) e relative porte e dettagli;
+- details: tutti gli altri dettagli, come coppie nome - lista dei valori.
+"""
+
+# Dettagli che non contengono informazioni sugli asset
+IGNORED_DETAILS = {"EXIT_CODE"}
+
+
+def get_detail_pairs(host):
+    """
+    Generatore che restituisce la coppia (nome, valore) per ogni
+    sotto-nodo detail del nodo host (XML)
+    """
+    for detail in host.findall("detail"):
+        yield detail.findtext("name"), detail.findtext("value")
+
+
+def create_host_assets(host) -> dict:
+    """
+    Crea e restituisce il dizionario degli asset del nodo host (XML)
+    """
+    os_cpes = []
+    os_names = []
+    best_os = {}
+    apps = {}
+    ssl_certs = {}
+    details = {}
+
+    def get_ssl_cert(fingerprint):
+        if fingerprint not in ssl_certs:
+            ssl_certs[fingerprint] = {"ports": [], "details": None}
+        return ssl_certs[fingerprint]
+
+    for name, value in get_detail_pairs(host):
+        if name is None or name in IGNORED_DETAILS:
+            continue
+        if name == "OS":
+            (os_cpes if (value or "").startswith("cpe:") else os_names) \
+                .append(value)
+        elif name in ("best_os_cpe", "best_os_txt"):
+            best_os[name] = value
+        elif name == "App":
+            apps.setdefault(value, [])
+        elif name.startswith("cpe:/a:"):
+            # Porta o percorso in cui è stata rilevata l'applicazione
+            apps.setdefault(name, []).append(value)
+        elif name == "SSLInfo":
+            # Il valore ha la forma porta::impronta
+            port, _, fingerprint = (value or "").partition("::")
+            get_ssl_cert(fingerprint)["ports"].append(port)
+        elif name.startswith("SSLDetails:"):
+            get_ssl_cert(name.partition(":")[2])["details"] = value
+        elif name.startswith("Cert:"):
+            get_ssl_cert(name.partition(":")[2])
+        else:
+            details.setdefault(name, []).append(value)
+
+    asset = host.find("asset")
+    asset_id = None if asset is None else asset.attrib.get("asset_id")
+    return {"asset_id": asset_id,
+            "start": host.findtext("start"),
+            "end": host.findtext("end"),
+            "os": {"cpes": os_cpes, "names": os_names, **best_os},
+            "apps": apps,
+            "ssl_certs": ssl_certs,
+            "details": details}
+
+
+def create_asset_index(hosts) -> dict:
+    """
+    Crea e restituisce l'indice degli asset: un dizionario contenente,
+    per l'indirizzo IP di ogni nodo host (XML), il relativo dizionario
+    degli asset. Se lo stesso host compare più volte viene mantenuto
+    l'ultimo nodo.
+    """
+    index = {}
+    for host in hosts:
+        index[host.findtext("ip")] = create_host_assets(host)
+    return index
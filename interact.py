@@ -371,66 +371,87 @@ PATH = getcwd() + r"/"
 ID_REGEX = r"^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}"
 PATTERN = compile(ID_REGEX)
 
-# Parser degli argomenti in input e relativi parametri inseriti
-parser = get_parser()
-args = vars(parser.parse_args())
-
-# Controllo dell'impostazione di debug
-DEBUG = args["debug"]
-
-# Acquisizione dei parametri inseriti in input
-param_list = check_input_parameters(args)
-return_value, control = check_parameters_list(param_list)
-
-# Controllo dei parametri inseriti in input
-if return_value == -1 or return_value == 0 or return_value is False:
-    print(control, file=stderr)
-    exit(-1)
-if return_value == -2:
-    print(control, file=stderr)
-if not check_parameters_pairing(param_list):
-    print("You didn't supply all the needed arguments for\
+# Controllo dell'impostazione di debug (si veda main)
+DEBUG = False
+
+# Console del client di Metasploit, utilizzata anche dalla callback
+# read_console (si veda main)
+console = None
+
+
+def main():
+    """
+    Main function. Legge i parametri inseriti in input, si connette a
+    Metasploit ed esegue le operazioni richieste.
+    """
+    global DEBUG, console
+
+    # Parser degli argomenti in input e relativi parametri inseriti
+    parser = get_parser()
+    args = vars(parser.parse_args())
+
+    # Controllo dell'impostazione di debug
+    DEBUG = args["debug"]
+
+    # Acquisizione dei parametri inseriti in input
+    param_list = check_input_parameters(args)
+    return_value, control = check_parameters_list(param_list)
+
+    # Controllo dei parametri inseriti in input
+    if return_value == -1 or return_value == 0 or return_value is False:
+        print(control, file=stderr)
+        exit(-1)
+    if return_value == -2:
+        print(control, file=stderr)
+    if not check_parameters_pairing(param_list):
+        print("You didn't supply all the needed arguments for\
          the command. Use --help.", file=stderr)
-    exit(-2)
+        exit(-2)
 
-# Inizializzazione console
-console = init_console(MSF_PASSWD)
+    # Inizializzazione console
+    console = init_console(MSF_PASSWD)
 
-# Controllo della corretta inizializzazione della console
-if not console:
-    print("Error initializing console.", file=stderr)
-    exit(-3)
+    # Controllo della corretta inizializzazione della console
+    if not console:
+        print("Error initializing console.", file=stderr)
+        exit(-3)
 
-# OUTPUT_FILE = PATH + args["output"]
+    # OUTPUT_FILE = PATH + args["output"]
 
-# Se tra gli argomenti c'è un'operazione riguardante il listing:
-if any(args[x] for x in set(args.keys())
-        .intersection(Parameters.LIST_COMMANDS.value)):
-    to_print = []
-    for k, v in args.items():
+    # Se tra gli argomenti c'è un'operazione riguardante il listing:
+    if any(args[x] for x in set(args.keys())
+            .intersection(Parameters.LIST_COMMANDS.value)):
+        to_print = []
+        for k, v in args.items():
+
+            # Per ognuna di esse, aggiungi alla lista delle stampe
+            if v and "list" in k:
+                to_print.append(k)
+
+        # Controllo su un eventuale fallimento della stampa
+        if not print_lists(console, to_print):
+            print(f"Error in function: {print_lists.__name__}",
+                  file=stderr)
 
-        # Per ognuna di esse, aggiungi alla lista delle stampe
-        if v and "list" in k:
-            to_print.append(k)
+    # Se tra gli argomenti c'è un'operazione riguardante un'azione
+    # da compiere:
+    if any(args[x] for x in set(args.keys())
+            .intersection(Parameters.ACTION_COMMANDS.value)):
 
-    # Controllo su un eventuale fallimento della stampa
-    if not print_lists(console, to_print):
-        print(f"Error in function: {print_lists.__name__}", file=stderr)
+        # Ottieni la funzione da eseguire e i relativi argomenti da
+        # i parametri in input
+        function, args = get_action(args)
 
-# Se tra gli argomenti c'è un'operazione riguardante un'azione da compiere:
-if any(args[x] for x in set(args.keys())
-        .intersection(Parameters.ACTION_COMMANDS.value)):
+        # Controllo su un eventuale fallimento della funzione
+        if not function(console, args):
+            print(f"Error in function: {function.__name__}", file=stderr)
 
-    # Ottieni la funzione da eseguire e i relativi argomenti da
-    # i parametri in input
-    function, args = get_action(args)
+    # Tempo di Timeout
+    sleep(SLEEP_BEFORE_EXITING_TIME)
 
-    # Controllo su un eventuale fallimento della funzione
-    if not function(console, args):
-        print(f"Error in function: {function.__name__}", file=stderr)
+    # Terminazione dell'esecuzione del programma
+    exit_successfully(console)
 
-# Tempo di Timeout
-sleep(SLEEP_BEFORE_EXITING_TIME)
 
-# Terminazione dell'esecuzione del programma
-exit_successfully(console)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Questo è un modulo di supporto per lo script cve_extractor.py
+
+Contiene un lettore incrementale di documenti json: il file viene letto
+a blocchi e percorso un valore alla volta, per cui vengono creati in
+memoria soltanto i valori effettivamente richiesti, mentre tutti gli
+altri (oggetti e liste compresi) vengono saltati senza essere costruiti.
+La memoria occupata non dipende quindi dalla dimensione del documento.
+
+Le stringhe e i valori semplici vengono decodificati con le funzioni
+(in C) del modulo json della libreria standard.
+"""
+from json import JSONDecodeError, JSONDecoder
+from json.decoder import scanstring
+from re import compile
+
+WHITESPACE = compile(r"[ \t\n\r]*")
+# Caratteri che terminano un numero o una costante (true, false, null)
+DELIMITER = compile(r"[ \t\n\r,\]}]")
+CHUNK_SIZE = 1 << 16
+
+
+class JsonStream:
+    """
+    Lettore incrementale di un documento json dal file (in modalità
+    testo) passato come parametro.
+
+    Gli oggetti e le liste vengono percorsi con iter_object e iter_array:
+    ad ogni passo il lettore è posizionato sul valore corrente, che deve
+    essere letto (read_value, oppure iter_object/iter_array se è un
+    contenitore) o saltato (skip_value) prima di proseguire.
+    """
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.decoder = JSONDecoder()
+
+    def fill(self) -> bool:
+        """
+        Aggiunge al buffer il blocco successivo del file, scartando la
+        parte già letta. Restituisce False se il file è terminato.
+        """
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Salta gli spazi e restituisce il carattere successivo, senza
+        consumarlo ("" alla fine del documento)
+        """
+        if self.position < len(self.buffer):
+            character = self.buffer[self.position]
+            if character not in " \t\n\r":
+                return character
+        while True:
+            self.position = WHITESPACE.match(self.buffer,
+                                             self.position).end()
+            if self.position < len(self.buffer) or not self.fill():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, characters) -> str:
+        """
+        Consuma e restituisce il carattere successivo, che deve essere
+        uno di quelli indicati
+        """
+        character = self.peek()
+        if not character or character not in characters:
+            raise JSONDecodeError(f"Expecting one of {characters!r}",
+                                  self.buffer, self.position)
+        self.position += 1
+        return character
+
+    def read_string(self) -> str:
+        """
+        Legge e restituisce la stringa successiva
+        """
+        self.expect('"')
+        while True:
+            try:
+                value, end = scanstring(self.buffer, self.position)
+            except JSONDecodeError:
+                # La stringa potrebbe continuare nel blocco successivo
+                if self.fill():
+                    continue
+                raise
+            self.position = end
+            return value
+
+    def read_value(self):
+        """
+        Legge e restituisce il valore successivo (di qualsiasi tipo)
+        """
+        # Un numero alla fine del buffer potrebbe essere incompleto: il
+        # buffer deve contenerne anche il carattere successivo
+        if self.peek() not in '{["':
+            while DELIMITER.search(self.buffer, self.position) is None and \
+                    self.fill():
+                pass
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer,
+                                                     self.position)
+            except JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            self.position = end
+            return value
+
+    def iter_object(self):
+        """
+        Generatore che restituisce, per ogni coppia dell'oggetto
+        successivo, la chiave; il lettore è posizionato sul relativo
+        valore
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self.read_string()
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    def iter_array(self):
+        """
+        Generatore che restituisce l'indice di ogni elemento della lista
+        successiva; il lettore è posizionato sul relativo elemento
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.expect(",]") == "]":
+                return
+
+    def skip_value(self):
+        """
+        Salta il valore successivo; oggetti e liste vengono percorsi
+        senza essere costruiti
+        """
+        character = self.peek()
+        if character == "{":
+            for _ in self.iter_object():
+                self.skip_value()
+        elif character == "[":
+            for _ in self.iter_array():
+                self.skip_value()
+        elif character == '"':
+            self.read_string()
+        else:
+            self.read_value()
@@ -0,0 +1,176 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Si occupa di scrivere su file il report in formato json in modo
+incrementale, una sezione alla volta, senza creare in memoria una copia
+dell'intero report sotto forma di stringa. I risultati possono inoltre
+essere serializzati e scritti su disco man mano che vengono prodotti.
+"""
+from json import dumps
+from tempfile import TemporaryFile
+
+# Nomi dei campi di ogni risultato nel report
+RESULT_COLUMN_NAMES = ("port", "nvt", "threat", "severity",
+                       "detection", "qod", "description")
+
+# Livello di annidamento di ogni risultato nel report:
+# report -> results -> host -> risultato
+RESULT_LEVEL = 3
+
+
+def get_separators(indent):
+    """
+    Restituisce i separatori utilizzati da json.dumps: con indentazione
+    quelli di default, senza indentazione quelli più compatti possibili
+    """
+    return (",", ": ") if indent is not None else (",", ":")
+
+
+def serialize(value, indent, level) -> str:
+    """
+    Serializza il valore passato come parametro come se si trovasse al
+    livello di annidamento level di un documento indentato con indent
+    spazi (oppure in forma compatta se indent è None).
+    """
+    text = dumps(value, indent=indent, separators=get_separators(indent))
+    if indent is None or level == 0:
+        return text
+    # Le stringhe json non contengono '\n' non codificati
+    return text.replace("\n", "\n" + " " * (indent * level))
+
+
+def get_newline(indent, level) -> str:
+    """
+    Restituisce il separatore tra gli elementi di un oggetto (o di una
+    lista) al livello di annidamento level
+    """
+    if indent is None:
+        return ""
+    return "\n" + " " * (indent * level)
+
+
+class ResultSpool:
+    """
+    Raccoglitore dei risultati prodotti da create_result_json.
+
+    Ogni risultato viene serializzato non appena prodotto e scritto in un
+    file temporaneo; in memoria rimangono soltanto, per ogni host, le
+    posizioni dei relativi risultati. In fase di scrittura i risultati
+    vengono copiati nel file di output raggruppati per host, nell'ordine
+    del documento.
+    """
+
+    def __init__(self, indent=4):
+        self.indent = indent
+        self.file = TemporaryFile()
+        self.hosts = {}
+
+    def add(self, host, json_element, result=None):
+        """
+        Serializza il risultato e lo aggiunge a quelli dell'host
+        """
+        data = serialize(json_element, self.indent, RESULT_LEVEL).encode()
+        if host not in self.hosts:
+            self.hosts[host] = []
+        self.hosts[host].append((self.file.tell(), len(data)))
+        self.file.write(data)
+
+    def iter_serialized(self, indent):
+        """
+        Generatore che restituisce, per ogni host, la coppia formata
+        dall'host e dal generatore dei relativi risultati serializzati,
+        letti dal file temporaneo
+        """
+        if indent != self.indent:
+            raise ValueError("The spool was created with a different indent")
+
+        def read_results(positions):
+            for offset, length in positions:
+                self.file.seek(offset)
+                yield self.file.read(length).decode()
+
+        for host, positions in self.hosts.items():
+            yield host, read_results(positions)
+
+    def close(self):
+        """
+        Chiude (ed elimina) il file temporaneo
+        """
+        self.file.close()
+
+
+class SerializedResults:
+    """
+    Risultati già serializzati (ad esempio da processi diversi, si veda
+    create_result_json_parallel), raggruppati per host nell'ordine in cui
+    vengono aggiunti
+    """
+
+    def __init__(self, indent=4):
+        self.indent = indent
+        self.hosts = {}
+
+    def extend(self, host, elements):
+        """
+        Aggiunge i risultati serializzati a quelli dell'host
+        """
+        if host not in self.hosts:
+            self.hosts[host] = []
+        self.hosts[host].extend(elements)
+
+    def iter_serialized(self, indent):
+        """
+        Generatore che restituisce, per ogni host, la coppia formata
+        dall'host e dai relativi risultati serializzati
+        """
+        if indent != self.indent:
+            raise ValueError("The results were serialized with a "
+                             "different indent")
+        yield from self.hosts.items()
+
+
+def write_grouped_results(f, groups, indent, level):
+    """
+    Scrive nel file f l'oggetto json contenente i risultati raggruppati
+    per host, a partire dalle coppie (host, risultati serializzati)
+    restituite da groups
+    """
+    key_separator = get_separators(indent)[1]
+    host_newline = get_newline(indent, level + 1)
+    element_newline = get_newline(indent, level + 2)
+
+    f.write("{")
+    host_number = -1
+    for host_number, (host, elements) in enumerate(groups):
+        f.write(("," if host_number else "") + host_newline +
+                dumps(host) + key_separator + "[")
+        for number, element in enumerate(elements):
+            f.write(("," if number else "") + element_newline + element)
+        f.write(host_newline + "]")
+    if host_number >= 0:
+        f.write(get_newline(indent, level))
+    f.write("}")
+
+
+def write_report(f, report, indent=4):
+    """
+    Scrive nel file f il report passato come parametro, una sezione alla
+    volta. L'output è identico a quello di json.dumps(report, indent=indent)
+    (o di json.dumps con separatori compatti se indent è None).
+
+    Le sezioni il cui valore dispone del metodo iter_serialized (ad
+    esempio un ResultSpool) vengono scritte un risultato alla volta.
+    """
+    if not report:
+        f.write("{}")
+        return
+    key_separator = get_separators(indent)[1]
+    f.write("{")
+    for number, (key, value) in enumerate(report.items()):
+        f.write(("," if number else "") + get_newline(indent, 1) +
+                dumps(key) + key_separator)
+        if hasattr(value, "iter_serialized"):
+            write_grouped_results(f, value.iter_serialized(indent), indent, 1)
+        else:
+            f.write(serialize(value, indent, 1))
+    f.write(get_newline(indent, 0) + "}")
@@ -0,0 +1,181 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Contiene la decodifica del campo tags degli nvt, una stringa di coppie
+nome=valore separate da "|" (ad esempio
+"cvss_base_vector=AV:N/AC:L/Au:N/C:N/I:N/A:N|summary=...|solution=...").
+
+NvtTags è una stringa (per cui viene serializzata in json senza
+modifiche) che decodifica le coppie soltanto al primo accesso e le
+memorizza; il vettore CVSS (versione 2 o 3.x) viene convertito nel
+relativo punteggio base numerico.
+"""
+from functools import lru_cache
+from math import floor
+
+CVSS_VECTOR_TAG = "cvss_base_vector"
+
+# Pesi delle metriche di base di CVSS v2
+CVSS2_WEIGHTS = {
+    "AV": {"L": 0.395, "A": 0.646, "N": 1.0},
+    "AC": {"H": 0.35, "M": 0.61, "L": 0.71},
+    "Au": {"M": 0.45, "S": 0.56, "N": 0.704},
+    "C": {"N": 0.0, "P": 0.275, "C": 0.660},
+    "I": {"N": 0.0, "P": 0.275, "C": 0.660},
+    "A": {"N": 0.0, "P": 0.275, "C": 0.660},
+}
+
+# Pesi delle metriche di base di CVSS v3.x; i pesi di PR dipendono da S
+CVSS3_WEIGHTS = {
+    "AV": {"N": 0.85, "A": 0.62, "L": 0.55, "P": 0.2},
+    "AC": {"L": 0.77, "H": 0.44},
+    "PR": {"U": {"N": 0.85, "L": 0.62, "H": 0.27},
+           "C": {"N": 0.85, "L": 0.68, "H": 0.5}},
+    "UI": {"N": 0.85, "R": 0.62},
+    "C": {"H": 0.56, "L": 0.22, "N": 0.0},
+    "I": {"H": 0.56, "L": 0.22, "N": 0.0},
+    "A": {"H": 0.56, "L": 0.22, "N": 0.0},
+}
+
+
+def parse_tags(text) -> dict:
+    """
+    Crea e restituisce il dizionario delle coppie nome - valore del campo
+    tags. Le parti senza "=" vengono considerate parte del valore
+    precedente, che conteneva quindi il carattere "|".
+    """
+    fields = {}
+    name = None
+    for part in (text or "").split("|"):
+        key, separator, value = part.partition("=")
+        if separator:
+            name = key
+            fields[name] = value
+        elif name is not None:
+            fields[name] += "|" + part
+    return fields
+
+
+def parse_cvss_vector(vector) -> dict:
+    """
+    Crea e restituisce il dizionario delle metriche del vettore CVSS
+    (ad esempio {"AV": "N", "AC": "L", ...}). Il prefisso della versione
+    (ad esempio CVSS:3.1) viene restituito con la chiave "CVSS".
+    """
+    metrics = {}
+    for part in (vector or "").split("/"):
+        name, separator, value = part.partition(":")
+        if separator:
+            metrics[name] = value
+    return metrics
+
+
+def round_up(value) -> float:
+    """
+    Arrotonda per eccesso alla prima cifra decimale, come previsto dalla
+    specifica di CVSS v3.1
+    """
+    integer = round(value * 100000)
+    if integer % 10000 == 0:
+        return integer / 100000
+    return (floor(integer / 10000) + 1) / 10
+
+
+def get_cvss2_base_score(metrics) -> float:
+    """
+    Restituisce il punteggio base CVSS v2 delle metriche
+    """
+    w = {name: CVSS2_WEIGHTS[name][metrics[name]] for name in CVSS2_WEIGHTS}
+    impact = 10.41 * (1 - (1 - w["C"]) * (1 - w["I"]) * (1 - w["A"]))
+    exploitability = 20 * w["AV"] * w["AC"] * w["Au"]
+    score = (0.6 * impact + 0.4 * exploitability - 1.5) * \
+        (0 if impact == 0 else 1.176)
+    return floor(score * 10 + 0.5) / 10
+
+
+def get_cvss3_base_score(metrics) -> float:
+    """
+    Restituisce il punteggio base CVSS v3.x delle metriche
+    """
+    changed = metrics["S"] == "C"
+    w = {name: CVSS3_WEIGHTS[name][metrics[name]]
+         for name in ("AV", "AC", "UI", "C", "I", "A")}
+    privileges = CVSS3_WEIGHTS["PR"]["C" if changed else "U"][metrics["PR"]]
+    iss = 1 - (1 - w["C"]) * (1 - w["I"]) * (1 - w["A"])
+    if changed:
+        impact = 7.52 * (iss - 0.029) - 3.25 * (iss - 0.02) ** 15
+    else:
+        impact = 6.42 * iss
+    if impact <= 0:
+        return 0.0
+    exploitability = 8.22 * w["AV"] * w["AC"] * privileges * w["UI"]
+    if changed:
+        return round_up(min(1.08 * (impact + exploitability), 10))
+    return round_up(min(impact + exploitability, 10))
+
+
+@lru_cache(maxsize=None)
+def get_cvss_base_score(vector) -> float:
+    """
+    Restituisce il punteggio base del vettore CVSS (versione 2 o 3.x);
+    restituisce NaN se il vettore è assente, incompleto o non valido.
+    I vettori distinti sono pochi, per cui i punteggi vengono memorizzati.
+    """
+    metrics = parse_cvss_vector(vector)
+    try:
+        if metrics.get("CVSS", "").startswith("3."):
+            return get_cvss3_base_score(metrics)
+        return get_cvss2_base_score(metrics)
+    except KeyError:
+        return float("nan")
+
+
+class NvtTags(str):
+    """
+    Campo tags di un nvt: la stringa originale, le cui coppie nome - valore
+    vengono decodificate soltanto al primo accesso (si veda fields)
+    """
+    __slots__ = ("_fields",)
+
+    @property
+    def fields(self) -> dict:
+        """
+        Dizionario delle coppie nome - valore, decodificato al primo
+        accesso e poi riutilizzato
+        """
+        try:
+            return self._fields
+        except AttributeError:
+            self._fields = parse_tags(self)
+            return self._fields
+
+    def get(self, name, default=None):
+        """
+        Restituisce il valore della coppia con il nome indicato
+        """
+        return self.fields.get(name, default)
+
+    @property
+    def cvss_vector(self) -> dict:
+        """
+        Dizionario delle metriche del vettore CVSS
+        """
+        return parse_cvss_vector(self.get(CVSS_VECTOR_TAG))
+
+    @property
+    def cvss_base_score(self) -> float:
+        """
+        Punteggio base del vettore CVSS (NaN se non disponibile)
+        """
+        return get_cvss_base_score(self.get(CVSS_VECTOR_TAG))
+
+
+def get_nvt_tags(tags) -> NvtTags:
+    """
+    Restituisce il campo tags come NvtTags, ad esempio per i report letti
+    da file json (si veda result_tables.load_report), in cui è una
+    stringa; None viene considerato un campo vuoto
+    """
+    if isinstance(tags, NvtTags):
+        return tags
+    return NvtTags(tags or "")
@@ -0,0 +1,129 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Implementa una cache dei report elaborati: la chiave è calcolata a partire
+dal contenuto del file XML e dai parametri che influenzano l'output, per
+cui un report già elaborato con gli stessi parametri viene copiato dalla
+cache senza essere nuovamente interpretato.
+
+La dimensione complessiva della cache è limitata: superato il limite
+vengono eliminati gli elementi utilizzati meno di recente.
+"""
+from hashlib import sha256
+from json import dumps
+from os import listdir, makedirs, remove, replace, stat, utime
+from os.path import expanduser, join
+from shutil import copyfileobj
+from tempfile import mkstemp
+from temp_files import create_temp_file, finalize_temp_file
+
+DEFAULT_CACHE_DIR = expanduser("~/.cache/xml_parser")
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+# Da incrementare quando cambia il formato dei report prodotti
+CACHE_VERSION = 6
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_cache_key(input_file, options) -> str:
+    """
+    Restituisce la chiave di cache del report: l'hash del contenuto del
+    file unito ai parametri (options) che determinano l'output
+    """
+    digest = sha256()
+    digest.update(dumps([CACHE_VERSION, options], sort_keys=True).encode())
+    with open(input_file, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    Cache su disco dei report elaborati.
+
+    Ogni elemento è un file il cui nome è la chiave di cache: la prima riga
+    contiene il nome (senza cartella) del file di output, il resto il
+    contenuto del file di output.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR,
+                 max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        makedirs(directory, exist_ok=True)
+
+    def restore(self, key, output_dir):
+        """
+        Se la chiave è presente in cache, scrive nella cartella output_dir
+        il file di output memorizzato e ne restituisce il nome.
+        Restituisce None altrimenti.
+        """
+        path = join(self.directory, key)
+        try:
+            cached = open(path, "rb")
+        except FileNotFoundError:
+            return None
+
+        # Il file viene copiato in un file temporaneo e rinominato al
+        # termine, come in xml_parser.write_report_to_file
+        with cached:
+            name = cached.readline().decode().rstrip("\n")
+            output_file = join(output_dir, name)
+            tmp_path = create_temp_file(output_dir)
+            try:
+                with open(tmp_path, "wb") as out:
+                    copyfileobj(cached, out)
+            except BaseException:
+                finalize_temp_file(tmp_path)
+                raise
+        finalize_temp_file(tmp_path, output_file)
+
+        # Aggiorna la data di ultimo utilizzo per l'eliminazione LRU;
+        # l'elemento potrebbe essere già stato eliminato da un altro
+        # processo, ma il file di output è comunque stato ripristinato
+        try:
+            utime(path)
+        except FileNotFoundError:
+            pass
+        return output_file
+
+    def store(self, key, output_file, name):
+        """
+        Memorizza in cache il file di output, con il nome da utilizzare al
+        momento del ripristino, ed elimina gli elementi meno recenti se la
+        cache supera la dimensione massima
+        """
+        fd, tmp_path = mkstemp(dir=self.directory, suffix=".tmp")
+        with open(fd, "wb") as cached, open(output_file, "rb") as out:
+            cached.write(name.encode() + b"\n")
+            copyfileobj(out, cached)
+        replace(tmp_path, join(self.directory, key))
+        self.evict()
+
+    def evict(self):
+        """
+        Elimina gli elementi utilizzati meno di recente finché la
+        dimensione della cache non rientra nel limite
+        """
+        entries = []
+        total = 0
+        for name in listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                st = stat(join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                remove(join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,106 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Misura, per ogni fase dell'elaborazione di un report (lettura, creazione
+delle singole sezioni, scrittura), il tempo reale, il tempo di CPU, il
+picco di memoria allocata dall'interprete (tracemalloc) e l'aumento del
+picco di memoria residente (RSS) del processo.
+
+tracemalloc non vede la memoria allocata dalle librerie in C, ad esempio
+l'albero di libxml2 creato da lxml: in tal caso la lettura del report
+risulta nella sola colonna RSS.
+"""
+from contextlib import contextmanager, nullcontext
+from json import dumps
+from resource import getrusage, RUSAGE_SELF
+from sys import platform
+from time import perf_counter, process_time
+import tracemalloc
+
+# Unità di misura di ru_maxrss: byte su macOS, kilobyte altrimenti
+MAXRSS_UNIT = 1 if platform == "darwin" else 1024
+
+
+def get_max_rss() -> int:
+    """
+    Restituisce il picco di memoria residente del processo, in byte
+    """
+    return getrusage(RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+
+
+class Profiler:
+    """
+    Raccoglie le misure delle fasi, nell'ordine in cui vengono eseguite.
+    Le fasi non devono essere annidate: il picco di memoria di ogni fase
+    viene azzerato al suo inizio. Il picco di memoria residente non può
+    essere azzerato: per ogni fase viene misurato di quanto lo aumenta.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    @contextmanager
+    def measure(self, name):
+        """
+        Context manager che misura la fase name
+        """
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        start_rss = get_max_rss()
+        start_wall = perf_counter()
+        start_cpu = process_time()
+        try:
+            yield
+        finally:
+            wall = perf_counter() - start_wall
+            cpu = process_time() - start_cpu
+            peak = tracemalloc.get_traced_memory()[1] - start_memory
+            rss = get_max_rss() - start_rss
+            self.phases.append({"phase": name,
+                                "wall_time": round(wall, 6),
+                                "cpu_time": round(cpu, 6),
+                                "peak_memory": peak,
+                                "peak_rss_increase": rss})
+
+    def stop(self):
+        """
+        Interrompe tracemalloc, se è stato avviato dal profiler
+        """
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def to_json(self) -> str:
+        """
+        Restituisce le misure in formato json
+        """
+        return dumps(self.phases, indent=4)
+
+    def to_table(self) -> str:
+        """
+        Restituisce le misure sotto forma di tabella
+        """
+        lines = [f"{'phase':<20}{'wall (s)':>12}{'cpu (s)':>12}"
+                 f"{'heap (MB)':>12}{'+rss (MB)':>12}"]
+        for phase in self.phases:
+            lines.append(f"{phase['phase']:<20}{phase['wall_time']:>12.4f}"
+                         f"{phase['cpu_time']:>12.4f}"
+                         f"{phase['peak_memory'] / 1024 / 1024:>12.2f}"
+                         f"{phase['peak_rss_increase'] / 1024 / 1024:>12.2f}")
+        total_wall = sum(phase["wall_time"] for phase in self.phases)
+        total_cpu = sum(phase["cpu_time"] for phase in self.phases)
+        lines.append(f"{'total':<20}{total_wall:>12.4f}{total_cpu:>12.4f}")
+        return "\n".join(lines)
+
+
+def profile(profiler, name):
+    """
+    Restituisce il context manager che misura la fase name, oppure un
+    context manager che non fa nulla se profiler è None
+    """
+    if profiler is None:
+        return nullcontext()
+    return profiler.measure(name)
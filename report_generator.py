@@ -0,0 +1,280 @@
+"""
+Questo modulo si occupa di generare report XML sintetici con la stessa
+struttura di quelli generati da OpenVAS (si veda Reports/raw_xml), con un
+numero configurabile di host, risultati, porte, errori e dettagli.
+
+Il report viene scritto su file man mano che viene generato, per cui è
+possibile creare report contenenti milioni di risultati.
+"""
+from argparse import ArgumentParser
+from random import Random
+from uuid import UUID
+from xml.sax.saxutils import escape
+
+THREATS = (("Log", 0.0, 0.0), ("Low", 0.1, 3.9),
+           ("Medium", 4.0, 6.9), ("High", 7.0, 10.0))
+THREAT_WEIGHTS = (60, 5, 25, 10)
+FAMILIES = ("Service detection", "General", "Web application abuses",
+            "Product detection", "SSL and TLS", "Denial of Service",
+            "Databases", "Web Servers", "Default Accounts", "FTP")
+QOD_TYPES = (("remote_banner", 80), ("remote_vul", 99),
+             ("remote_app", 98), ("package", 97), ("executable_version", 80))
+SERVICES = ("21/tcp", "22/tcp", "25/tcp", "53/tcp", "80/tcp", "110/tcp",
+            "111/tcp", "143/tcp", "443/tcp", "993/tcp", "995/tcp",
+            "3306/tcp", "5432/tcp", "8080/tcp", "general/tcp",
+            "general/icmp", "general/CPE-T")
+DATE = "2020-08-30T15:42:07Z"
+
+
+def get_parser():
+    """
+    Crea e restituisce il parser dei parametri inseriti a linea di comando.
+    """
+    parser = ArgumentParser(
+        description='Generate a synthetic XML report with the same '
+                    'structure of the ones created by OpenVAS.')
+    parser.add_argument('--hosts', type=int, default=1,
+        help='Number of scanned hosts (default: 1)')
+    parser.add_argument('--results', type=int, default=100,
+        help='Total number of results (default: 100)')
+    parser.add_argument('--ports', type=int, default=10,
+        help='Number of open ports per host (default: 10)')
+    parser.add_argument('--errors', type=int, default=1,
+        help='Total number of errors (default: 1)')
+    parser.add_argument('--details', type=int, default=20,
+        help='Number of detail entries per host (default: 20)')
+    parser.add_argument('--nvts', type=int, default=500,
+        help='Number of distinct NVTs the results refer to (default: 500)')
+    parser.add_argument('--seed', type=int, default=0,
+        help='Random seed (default: 0)')
+    parser.add_argument('--output', required=True,
+        help='Output file')
+
+    return parser
+
+
+def get_uuid(rand) -> str:
+    """
+    Restituisce un uuid (versione 4) generato a partire da rand, in modo
+    che i report generati con lo stesso seed siano identici
+    """
+    return str(UUID(int=rand.getrandbits(128), version=4))
+
+
+def get_host(index) -> str:
+    """
+    Restituisce l'indirizzo ip dell'host di indice index (10.x.y.z)
+    """
+    return f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+
+
+def create_nvts(rand, number) -> list:
+    """
+    Crea e restituisce una lista di nvt (dizionari) da cui vengono
+    estratti i risultati
+    """
+    nvts = []
+    for index in range(number):
+        threat, low, high = rand.choices(THREATS, THREAT_WEIGHTS)[0]
+        severity = round(rand.uniform(low, high), 1)
+        cves = [f"CVE-{rand.randint(1999, 2020)}-{rand.randint(1, 20000)}"
+                for _ in range(rand.choice((0, 0, 1, 1, 2, 4)))]
+        qod_type, qod = rand.choice(QOD_TYPES)
+        nvts.append({
+            "oid": f"1.3.6.1.4.1.25623.1.0.{100000 + index}",
+            "name": f"Synthetic NVT {index}",
+            "family": rand.choice(FAMILIES),
+            "cvss_base": f"{severity:.1f}",
+            "cve": ", ".join(cves) if cves else "NOCVE",
+            "tags": f"cvss_base_vector=AV:N/AC:L/Au:N/C:N/I:N/A:N|"
+                    f"summary=Synthetic check number {index}.|"
+                    f"solution_type=VendorFix|qod_type={qod_type}",
+            "threat": threat,
+            "severity": f"{severity:.1f}",
+            "qod": str(qod),
+            "qod_type": qod_type,
+            "description": rand.choice(
+                ("", f"Detected by synthetic check {index}.",
+                 "Installed version: 2.4.6\nFixed version: 2.4.39\n"))})
+    return nvts
+
+
+def write_result(out, rand, host, port, nvt, detection):
+    """
+    Scrive nel file out un nodo result (XML)
+    """
+    out.write(f"<result id='{get_uuid(rand)}'><name>{escape(nvt['name'])}"
+              f"</name><owner><name>admin</name></owner><comment/>"
+              f"<creation_time>{DATE}</creation_time><modification_time>"
+              f"{DATE}</modification_time><user_tags><count>0</count>"
+              f"</user_tags>")
+    if detection:
+        out.write(f"<detection><result id='{get_uuid(rand)}'><details>"
+                  f"<detail><name>product</name><value>cpe:/a:apache:"
+                  f"http_server:2.4.6</value></detail><detail><name>"
+                  f"location</name><value>{port}</value></detail>"
+                  f"</details></result></detection>")
+    out.write(f"<host>{host}<asset asset_id='{get_uuid(rand)}'/></host>"
+              f"<port>{port}</port><nvt oid='{nvt['oid']}'><type>nvt</type>"
+              f"<name>{escape(nvt['name'])}</name><family>"
+              f"{escape(nvt['family'])}</family><cvss_base>"
+              f"{nvt['cvss_base']}</cvss_base><cve>{nvt['cve']}</cve>"
+              f"<bid>NOBID</bid><xref>NOXREF</xref><tags>"
+              f"{escape(nvt['tags'])}</tags><cert/></nvt><scan_nvt_version>"
+              f"2020-03-27T07:53:12+0000</scan_nvt_version><threat>"
+              f"{nvt['threat']}</threat><severity>{nvt['severity']}"
+              f"</severity><qod><value>{nvt['qod']}</value><type>"
+              f"{nvt['qod_type']}</type></qod>")
+    if nvt["description"]:
+        out.write(f"<description>{escape(nvt['description'])}"
+                  f"</description></result>")
+    else:
+        out.write("<description/></result>")
+
+
+def write_host(out, rand, host, ports, results, details):
+    """
+    Scrive nel file out un nodo host (XML) con i relativi dettagli
+    """
+    out.write(f"<host><ip>{host}</ip><asset asset_id='{get_uuid(rand)}'/>"
+              f"<start/><end/><port_count><page>{ports}</page></port_count>"
+              f"<result_count><page>{results}</page><hole><page>0</page>"
+              f"</hole><warning><page>0</page></warning><info><page>0"
+              f"</page></info><log><page>0</page></log><false_positive>"
+              f"<page>0</page></false_positive></result_count>")
+    for index in range(details):
+        name, value = rand.choice(
+            (("best_os_txt", "CentOS"), ("App", "cpe:/a:apache:http_server"),
+             ("hostname", f"host-{index}.example"),
+             ("EXIT_CODE", "EXIT_NOTVULN"), ("ports", "22,80,443"),
+             ("cpuinfo", "x86_64"), ("OS", "cpe:/o:centos:centos:7")))
+        out.write(f"<detail><name>{name}</name><value>{escape(value)}"
+                  f"</value><source><type>nvt</type><name>1.3.6.1.4.1."
+                  f"25623.1.0.{105937 + index};</name><description>"
+                  f"Synthetic detail</description></source><extra/>"
+                  f"</detail>")
+    out.write("</host>")
+
+
+def generate_report(output_file, hosts=1, results=100, ports=10, errors=1,
+                    details=20, nvts=500, seed=0) -> str:
+    """
+    Genera un report sintetico e lo scrive nel file output_file.
+
+    Restituisce l'id del task a cui fa riferimento il report, ovvero il
+    nome (senza estensione) del file prodotto da xml_parser.py.
+    """
+    rand = Random(seed)
+    task_id = get_uuid(rand)
+    report_id = get_uuid(rand)
+    nvt_list = create_nvts(rand, max(nvts, 1))
+    host_list = [get_host(index + 1) for index in range(max(hosts, 1))]
+    port_list = {host: sorted(rand.sample(SERVICES,
+                                          min(ports, len(SERVICES))))
+                 for host in host_list}
+
+    # Numero di risultati per ogni host
+    per_host = [results // len(host_list)] * len(host_list)
+    for index in range(results % len(host_list)):
+        per_host[index] += 1
+
+    with open(output_file, "w") as out:
+        out.write(f"<get_reports_response status='200' status_text='OK'>"
+                  f"<report content_type='text/xml' extension='xml' "
+                  f"id='{report_id}' type='scan'><owner><name>admin</name>"
+                  f"</owner><name/><comment/><creation_time/>"
+                  f"<modification_time>{DATE}</modification_time><writable>"
+                  f"0</writable><in_use>0</in_use><task id='{task_id}'><name>"
+                  f"synthetic</name></task><report_format><name>XML</name>"
+                  f"</report_format><report id='{report_id}'><omp><version>"
+                  f"7.0</version></omp><scan_run_status>Done"
+                  f"</scan_run_status><hosts><count>{len(host_list)}</count>"
+                  f"</hosts><closed_cves><count>0</count></closed_cves><vulns>"
+                  f"<count>{min(results, len(nvt_list))}</count></vulns><os>"
+                  f"<count>1</count></os><apps><count>1</count></apps>"
+                  f"<ssl_certs><count>0</count></ssl_certs><task "
+                  f"id='{task_id}'><name>synthetic</name><comment>generated"
+                  f"</comment><target id='{get_uuid(rand)}'><trash>0</trash>"
+                  f"</target><progress>-1</progress><user_tags><count>0"
+                  f"</count></user_tags></task><timestamp>2020-08-30T15:40:10Z"
+                  f"</timestamp><scan_start/><timezone>Coordinated Universal "
+                  f"Time</timezone><timezone_abbrev>UTC</timezone_abbrev>")
+
+        # Porte
+        total_ports = sum(len(p) for p in port_list.values())
+        out.write(f"<ports max='1000' start='1'><count>{total_ports}</count>")
+        for host in host_list:
+            for port in port_list[host]:
+                threat, low, _ = rand.choices(THREATS, THREAT_WEIGHTS)[0]
+                out.write(f"<port><host>{host}</host>{port}<severity>"
+                          f"{low:.1f}</severity><threat>{threat}</threat>"
+                          f"</port>")
+        out.write("</ports>")
+
+        # Risultati: come nei report reali, ordinati per nome, i risultati
+        # dei diversi host sono intercalati
+        threats = {}
+        max_severity = 0.0
+        out.write("<results max='1000' start='1'>")
+        for index in range(results):
+            host = host_list[index % len(host_list)]
+            nvt = rand.choice(nvt_list)
+            port = rand.choice(port_list[host] or ["general/tcp"])
+            write_result(out, rand, host, port, nvt,
+                         detection=rand.random() < 0.02)
+            threats[nvt["threat"]] = threats.get(nvt["threat"], 0) + 1
+            max_severity = max(max_severity, float(nvt["severity"]))
+        out.write("</results>")
+
+        out.write(f"<result_count>{results}<full>{results}</full><filtered>"
+                  f"{results}</filtered>")
+        for tag, threat in (("debug", None), ("hole", "High"),
+                            ("info", "Low"), ("log", "Log"),
+                            ("warning", "Medium"), ("false_positive", None)):
+            count = threats.get(threat, 0)
+            out.write(f"<{tag}><full>{count}</full><filtered>{count}"
+                      f"</filtered></{tag}>")
+        out.write(f"</result_count><severity><full>{max_severity:.1f}</full>"
+                  f"<filtered>{max_severity:.1f}</filtered></severity>")
+
+        # Host, con i relativi dettagli
+        for host, count in zip(host_list, per_host):
+            write_host(out, rand, host, len(port_list[host]), count, details)
+        for host in host_list:
+            out.write(f"<host_start><host>{host}</host></host_start>")
+        for host in host_list:
+            out.write(f"<host_end><host>{host}</host></host_end>")
+        out.write(f"<scan_end>{DATE}</scan_end>")
+
+        # Errori
+        out.write(f"<errors><count>{errors}</count>")
+        for index in range(errors):
+            host = host_list[index % len(host_list)]
+            nvt = rand.choice(nvt_list)
+            out.write(f"<error><host>{host}<asset asset_id="
+                      f"'{get_uuid(rand)}'/></host><port>general/tcp"
+                      f"</port><description>NVT timed out after 320 seconds."
+                      f"</description><nvt oid='{nvt['oid']}'><type>nvt"
+                      f"</type><name>{escape(nvt['name'])}</name><cvss_base>"
+                      f"{nvt['cvss_base']}</cvss_base></nvt><scan_nvt_version>"
+                      f"2020-05-06T12:58:00+0000</scan_nvt_version><severity>"
+                      f"-3.0</severity></error>")
+        out.write("</errors><report_format/></report></report>"
+                  "<report_count>1<filtered>1</filtered><page>1</page>"
+                  "</report_count></get_reports_response>")
+
+    return task_id
+
+
+def main():
+    """
+    Main function.
+    """
+    args = vars(get_parser().parse_args())
+    output_file = args.pop("output")
+    task_id = generate_report(output_file, **args)
+    print(f"Report {task_id} written to {output_file}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Si occupa di indicizzare, con una sola lettura del file, le posizioni
+(in byte) delle sezioni di un report XML generato da OpenVAS, in modo da
+poter leggere e interpretare soltanto le sezioni richieste.
+"""
+from xml.parsers.expat import ParserCreate
+from os import stat
+from json import load, dump
+from re import compile
+from sys import stderr
+
+# Percorsi dei nodi i cui sotto-nodi vengono indicizzati:
+# get_reports_response -> report -> report -> sezioni
+GENERAL_REPORT_PATH = ["get_reports_response", "report"]
+REPORT_PATH = ["get_reports_response", "report", "report"]
+
+INDEX_VERSION = 2
+
+# Confine tra due nodi result consecutivi della sezione results: i nodi
+# result annidati (in detection) non sono mai preceduti da </result>
+RESULT_BOUNDARY = compile(rb"</result>\s*(<result[\s>/])")
+BOUNDARY_WINDOW = 64 * 1024
+
+
+def get_index_file_name(input_file):
+    """
+    Computa e restituisce il nome del file di indice (sidecar)
+    associato al report passato come parametro
+    """
+    return input_file + ".idx"
+
+
+def get_file_signature(input_file) -> dict:
+    """
+    Restituisce dimensione e data di ultima modifica del file, utilizzate
+    per capire se un indice salvato è ancora valido
+    """
+    st = stat(input_file)
+    return {"size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def build_index(input_file) -> dict:
+    """
+    Legge una sola volta il report e restituisce un dizionario contenente,
+    per ogni sotto-nodo del report generico ("general") e del report vero
+    e proprio ("report"), la lista degli intervalli [inizio, fine) in byte
+    in cui compare, nell'ordine del documento, e gli attributi del nodo
+    del report generico ("attributes"), ad esempio l'id del report.
+    """
+    sections = {"general": {}, "report": {}, "attributes": {}}
+    parser = ParserCreate()
+    path = []
+    starts = []
+
+    def start_element(name, attrs):
+        path.append(name)
+        starts.append(parser.CurrentByteIndex)
+        if path == GENERAL_REPORT_PATH:
+            sections["attributes"] = attrs
+
+    def end_element(name):
+        path.pop()
+        start = starts.pop()
+        if path == GENERAL_REPORT_PATH:
+            level = sections["general"]
+        elif path == REPORT_PATH:
+            level = sections["report"]
+        else:
+            return
+        if name not in level:
+            level[name] = []
+        level[name].append([start, parser.CurrentByteIndex])
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+
+    with open(input_file, "rb") as f:
+        parser.ParseFile(f)
+
+        # Expat indica l'inizio del tag di chiusura: sposta la fine
+        # dell'intervallo subito dopo il carattere '>'. Per i nodi vuoti
+        # (<tag/>) la posizione indicata è già quella corretta.
+        for level in (sections["general"], sections["report"]):
+            for name, ranges in level.items():
+                closing_tag = ("</" + name).encode()
+                for byte_range in ranges:
+                    f.seek(byte_range[1])
+                    chunk = f.read(len(closing_tag) + 64)
+                    if chunk.startswith(closing_tag) and \
+                            chunk[len(closing_tag):][:1] in b"> \t\r\n":
+                        byte_range[1] += chunk.index(b">") + 1
+
+    return sections
+
+
+def load_index(input_file) -> dict:
+    """
+    Restituisce l'indice del report passato come parametro.
+    Se esiste un file di indice valido viene letto da questo, altrimenti
+    l'indice viene ricostruito e salvato accanto al report.
+    """
+    index_file = get_index_file_name(input_file)
+    signature = get_file_signature(input_file)
+    try:
+        with open(index_file) as f:
+            index = load(f)
+        if index["version"] == INDEX_VERSION and \
+                index["signature"] == signature:
+            return index["sections"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    sections = build_index(input_file)
+    try:
+        with open(index_file, "w") as f:
+            dump({"version": INDEX_VERSION,
+                  "signature": signature,
+                  "sections": sections}, f)
+    except OSError:
+        print(f"Unable to write index file {index_file}.", file=stderr)
+    return sections
+
+
+class SectionReader:
+    """
+    Oggetto file-like in sola lettura che espone soltanto l'intervallo
+    [start, end) di un file. Utilizzabile con iterparse per leggere
+    incrementalmente una singola sezione.
+    """
+
+    def __init__(self, f, start, end):
+        self.f = f
+        self.position = start
+        self.end = end
+
+    def read(self, size=-1):
+        remaining = self.end - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        self.f.seek(self.position)
+        data = self.f.read(size)
+        self.position += len(data)
+        return data
+
+
+def read_section(f, byte_range) -> bytes:
+    """
+    Legge e restituisce i byte della sezione indicata dall'intervallo
+    """
+    start, end = byte_range
+    f.seek(start)
+    return f.read(end - start)
+
+
+def find_result_boundary(f, position, end):
+    """
+    Restituisce la posizione del primo nodo result, preceduto da un altro
+    nodo result, che inizia dopo position; end se non ce ne sono
+    """
+    while position < end:
+        f.seek(position)
+        # La finestra si sovrappone alla successiva per non perdere i
+        # confini a cavallo tra le due
+        window = f.read(min(BOUNDARY_WINDOW, end - position))
+        match = RESULT_BOUNDARY.search(window)
+        if match is not None:
+            return position + match.start(1)
+        if position + len(window) >= end:
+            break
+        position += max(len(window) - 256, 1)
+    return end
+
+
+def split_results(f, byte_range, chunks) -> list:
+    """
+    Divide il contenuto della sezione results indicata dall'intervallo in
+    (al più) chunks intervalli di dimensione simile, allineati ai nodi
+    result, e ne restituisce la lista nell'ordine del documento
+    """
+    start, end = byte_range
+    data = read_section(f, (start, min(end, start + BOUNDARY_WINDOW)))
+    opening_tag = data[:data.index(b">") + 1]
+    if opening_tag.endswith(b"/>"):
+        # Sezione vuota (<results/>)
+        return []
+
+    # Il contenuto è compreso tra il tag di apertura e quello di chiusura
+    body_start = start + len(opening_tag)
+    tail = read_section(f, (max(start, end - 64), end))
+    body_end = end - (len(tail) - tail.rindex(b"</results"))
+
+    boundaries = [body_start]
+    step = (body_end - body_start) / max(chunks, 1)
+    for number in range(1, chunks):
+        target = max(int(body_start + number * step), boundaries[-1] + 1)
+        boundary = find_result_boundary(f, target, body_end)
+        if boundary >= body_end:
+            break
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    boundaries.append(body_end)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def build_partial_report(f, sections, general_tags, report_tags, backend):
+    """
+    Crea e restituisce i nodi del report generico e del report (XML)
+    contenenti soltanto le sezioni richieste, interpretate con il backend
+    indicato (si veda xml_backend) a partire dagli intervalli dell'indice
+    e nell'ordine del documento. Il nodo del report generico ha gli
+    attributi di quello originale.
+    """
+    general_report = backend.Element("report", sections["attributes"])
+    report = backend.Element("report")
+    for parent, level, tags in ((general_report, sections["general"],
+                                 general_tags),
+                                (report, sections["report"], report_tags)):
+        ranges = []
+        for tag in tags:
+            ranges.extend(level.get(tag, []))
+        for byte_range in sorted(ranges):
+            parent.append(backend.fromstring(read_section(f, byte_range)))
+    return general_report, report
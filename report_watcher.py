@@ -0,0 +1,264 @@
+"""
+Questo modulo si occupa di sorvegliare una cartella (ad esempio quella in
+cui interact.py --report-download salva i report) e di elaborare ogni
+nuovo report (XML) non appena è stato scritto completamente.
+
+I report vengono elaborati da un pool di processi creato una sola volta,
+senza avviare un nuovo interprete per ogni file: per ognuno viene creato
+il report in formato json (xml_parser.py) e, se richiesto, la lista delle
+CVE (cve_extractor.py) e le relative informazioni (cve.py). I file
+prodotti possono essere spostati in una cartella di destinazione, e ogni
+report può essere aggiunto all'indice inverso delle CVE (cve_index.py).
+
+Un file è considerato completo quando dimensione e data di modifica non
+cambiano per almeno --settle secondi; i file ancora in scrittura vengono
+ignorati fino ad allora.
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from fnmatch import fnmatch
+from json import dumps
+from os import listdir, makedirs, stat, getcwd
+from os.path import basename, isfile, join
+from shlex import split
+from shutil import move
+from signal import signal, SIGINT, SIG_IGN
+from sys import stderr
+from time import monotonic, sleep
+import xml_parser
+import cve_extractor
+from compression import open_file, strip_compression
+
+
+def get_parser():
+    """
+    Crea e restituisce il parser dei parametri inseriti a linea di comando.
+    """
+    parser = ArgumentParser(
+        description='Watch a directory and parse every OpenVAS XML report '
+                    'as soon as it has been completely written.')
+    parser.add_argument('--watch-dir', default=getcwd(),
+        help='Directory to watch (default: current directory)')
+    parser.add_argument('--pattern', default='*.xml,*.xml.gz,*.xml.xz',
+        help='Comma separated glob patterns of the reports '
+             '(default: *.xml,*.xml.gz,*.xml.xz)')
+    parser.add_argument('--parser-args', default='--all',
+        help='xml_parser.py arguments, passed as '
+             '--parser-args="--all --stream" (default: --all)')
+    parser.add_argument('--cve', action='store_true',
+        help='Also extract the CVE list of every report')
+    parser.add_argument('--enrich', action='store_true',
+        help='Also request the information of every CVE to CIRCL\'s API '
+             '(implies --cve)')
+    parser.add_argument('--cve-index',
+        help='Also add every report to this persistent CVE index (SQLite, '
+             'see cve_extractor.py --index-db)')
+    parser.add_argument('--downstream',
+        help='Move the produced files to this directory')
+    parser.add_argument('--interval', type=float, default=0.5,
+        help='Seconds between two scans of the directory (default: 0.5)')
+    parser.add_argument('--settle', type=float, default=2.0,
+        help='Seconds a report must stay unchanged to be considered '
+             'complete (default: 2)')
+    parser.add_argument('--skip-existing', action='store_true',
+        help='Ignore the reports already present at startup')
+    parser.add_argument('--workers', type=int,
+        help='Number of worker processes (default: number of CPUs)')
+
+    return parser
+
+
+def scan_directory(directory, patterns) -> dict:
+    """
+    Restituisce un dizionario contenente, per ogni file della cartella
+    corrispondente ad uno dei pattern, la coppia (dimensione, data di
+    modifica) che ne identifica il contenuto
+    """
+    signatures = {}
+    for name in listdir(directory):
+        if not any(fnmatch(name, pattern) for pattern in patterns):
+            continue
+        path = join(directory, name)
+        try:
+            st = stat(path)
+        except FileNotFoundError:
+            continue
+        if isfile(path):
+            signatures[path] = (st.st_size, st.st_mtime_ns)
+    return signatures
+
+
+def extract_cves(output_file) -> str:
+    """
+    Estrae la lista delle CVE dal report in formato json, letto in modo
+    incrementale, e la scrive nel relativo file (si veda
+    cve_extractor.py), di cui restituisce il nome
+    """
+    cve_file = cve_extractor.get_output_file_name(output_file)
+    cve_extractor.write_list_to_file(
+        cve_file, cve_extractor.iter_unique_cves(
+            cve_extractor.iter_json_cve_fields(output_file)))
+    return cve_file
+
+
+# Sessione HTTP del processo, riutilizzata per tutti i report
+# (si veda get_session)
+session = None
+
+
+def get_session():
+    """
+    Restituisce la sessione HTTP (requests.Session) del processo,
+    creandola alla prima richiesta, così che le connessioni all'API del
+    CIRCL vengano riutilizzate tra un report e l'altro (si veda
+    cve.create_session)
+    """
+    global session
+    if session is None:
+        # cve.py richiede il modulo requests soltanto se utilizzato
+        import cve
+        session = cve.create_session()
+    return session
+
+
+def enrich_cves(cve_file) -> str:
+    """
+    Richiede all'API del CIRCL le informazioni relative alle CVE del file
+    e le scrive nel relativo file (si veda cve.py), di cui restituisce
+    il nome
+    """
+    # cve.py richiede il modulo requests soltanto se utilizzato
+    import cve
+
+    out = cve.enrich(cve.get_file_data(cve_file), session=get_session())
+    enriched_file = cve.get_output_file_name(cve_file, "circl")
+    with open_file(enriched_file, "w") as f:
+        f.write(dumps(out, indent=4))
+    return enriched_file
+
+
+def ignore_interrupt():
+    """
+    Inizializzazione dei processi del pool: Ctrl+C viene gestito soltanto
+    dal processo principale, che attende i report in elaborazione
+    """
+    signal(SIGINT, SIG_IGN)
+
+
+def process_watched_report(input_file, args, options) -> list:
+    """
+    Elabora il report in un processo del pool: crea il report in formato
+    json e, se richiesto, la lista delle CVE e le relative informazioni.
+    I file prodotti vengono spostati nella cartella di destinazione,
+    se indicata.
+
+    Restituisce la lista dei file prodotti.
+    """
+    output_file = xml_parser.process_report(input_file,
+                                            dict(args, input=input_file))
+    outputs = [output_file]
+
+    if options["cve_index"]:
+        cve_extractor.index_report(options["cve_index"], input_file,
+                                   args.get("backend"))
+
+    # Le CVE possono essere estratte soltanto dai report in formato json
+    # che contengono i risultati
+    if (options["cve"] or options["enrich"]) and \
+            (args.get("all") or args.get("results")) and \
+            strip_compression(output_file).endswith(".json"):
+        cve_file = extract_cves(output_file)
+        outputs.append(cve_file)
+        if options["enrich"]:
+            outputs.append(enrich_cves(cve_file))
+
+    if options["downstream"]:
+        outputs = [move(name, join(options["downstream"], basename(name)))
+                   for name in outputs]
+    return outputs
+
+
+def watch(directory, patterns, args, options, interval, settle,
+          skip_existing=False, max_workers=None):
+    """
+    Sorveglia la cartella ed elabora, nel pool di processi, ogni report
+    nuovo o modificato non appena il suo contenuto resta invariato per
+    settle secondi. Termina con Ctrl+C, dopo aver atteso i report in
+    elaborazione.
+    """
+    # Contenuto (dimensione, data di modifica) dei report già elaborati
+    processed = scan_directory(directory, patterns) if skip_existing else {}
+    # Report in attesa: contenuto e istante dell'ultima modifica osservata
+    candidates = {}
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=ignore_interrupt) as executor:
+        print(f"Watching {directory} ({', '.join(patterns)}).")
+        try:
+            while True:
+                now = monotonic()
+                in_progress = {path for path, _ in running.values()}
+                for path, signature in \
+                        scan_directory(directory, patterns).items():
+                    if processed.get(path) == signature or \
+                            path in in_progress:
+                        continue
+                    candidate = candidates.get(path)
+                    if candidate is None or candidate[0] != signature:
+                        # Nuovo file oppure file ancora in scrittura
+                        candidates[path] = (signature, now)
+                    elif now - candidate[1] >= settle:
+                        del candidates[path]
+                        print(f"Processing {path}.")
+                        future = executor.submit(process_watched_report,
+                                                 path, args, options)
+                        running[future] = (path, signature)
+
+                if not running:
+                    sleep(interval)
+                    continue
+
+                done, _ = wait(running, timeout=interval,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, signature = running.pop(future)
+                    # Un report che ha generato errori non viene elaborato
+                    # di nuovo finché il suo contenuto non cambia
+                    processed[path] = signature
+                    try:
+                        for output_file in future.result():
+                            print(f"Produced {output_file}.")
+                    except Exception as e:
+                        print(f"Error while processing {path}: {e}",
+                              file=stderr)
+        except KeyboardInterrupt:
+            print("Stopping, waiting for the reports being processed.")
+
+
+def main():
+    """
+    Main function.
+    """
+    parser = get_parser()
+    args = vars(parser.parse_args())
+    patterns = [pattern for pattern in args["pattern"].split(",") if pattern]
+
+    # I parametri di xml_parser.py vengono validati una sola volta;
+    # il file di input viene poi sostituito per ogni report
+    parser_args = vars(xml_parser.get_parser().parse_args(
+        ["--input", "-", *split(args["parser_args"])]))
+
+    options = {"cve": args["cve"], "enrich": args["enrich"],
+               "cve_index": args["cve_index"],
+               "downstream": args["downstream"]}
+    if args["downstream"]:
+        makedirs(args["downstream"], exist_ok=True)
+
+    watch(args["watch_dir"], patterns, parser_args, options,
+          args["interval"], args["settle"], args["skip_existing"],
+          args["workers"])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Raccoglie i risultati prodotti da create_result_json in colonne tipizzate
+(gravità e punteggio base CVSS dell'nvt come float, qod come intero,
+host, porta e minaccia come categorie codificate da interi) e calcola su
+di esse, con NumPy, le statistiche per host e per minaccia: istogrammi,
+percentili e gravità massima.
+
+NumPy è necessario soltanto per la conversione in array e per il calcolo
+delle statistiche.
+"""
+from array import array
+from json import dumps
+from compression import open_file
+from nvt_tags import get_nvt_tags
+from temp_files import create_temp_file, finalize_temp_file
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Estremi degli intervalli di gravità degli istogrammi: [0, 1), ..., [9, 10]
+SEVERITY_BINS = 10
+PERCENTILES = (50, 75, 90, 95, 99)
+
+
+def check_numpy():
+    """
+    Solleva un'eccezione se NumPy non è installato
+    """
+    if np is None:
+        raise ImportError("NumPy is required for typed columns and "
+                          "statistics (pip install numpy)")
+
+
+class Categories:
+    """
+    Codifica dei valori di una colonna categorica: ad ogni valore distinto
+    corrisponde un intero, nell'ordine in cui i valori sono incontrati
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value) -> int:
+        """
+        Restituisce il codice del valore, assegnandone uno nuovo se
+        il valore non è mai stato incontrato
+        """
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+def parse_float(text) -> float:
+    """
+    Converte il testo in float; restituisce NaN se il testo è vuoto o
+    non è un numero
+    """
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def parse_int(text) -> int:
+    """
+    Converte il testo in intero; restituisce -1 se il testo è vuoto o
+    non è un numero
+    """
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return -1
+
+
+class ColumnCollector:
+    """
+    Raccoglitore dei risultati prodotti da create_result_json (si veda il
+    parametro sink), memorizzati in colonne tipizzate
+    """
+
+    def __init__(self, column_names):
+        self.column_names = column_names
+        self.hosts = Categories()
+        self.ports = Categories()
+        self.threats = Categories()
+        self.host_codes = array("i")
+        self.port_codes = array("i")
+        self.threat_codes = array("i")
+        self.severity = array("d")
+        self.qod = array("i")
+        self.cvss = array("d")
+
+    def add(self, host, json_element, result=None):
+        """
+        Aggiunge il risultato alle colonne
+        """
+        names = self.column_names
+        self.host_codes.append(self.hosts.encode(host))
+        self.port_codes.append(self.ports.encode(json_element[names[0]]))
+        self.threat_codes.append(self.threats.encode(json_element[names[2]]))
+        self.severity.append(parse_float(json_element[names[3]]))
+        self.qod.append(parse_int(json_element[names[5]].get("value")))
+        self.cvss.append(
+            get_nvt_tags(json_element[names[1]].get("tags")).cvss_base_score)
+
+    def to_arrays(self) -> dict:
+        """
+        Restituisce le colonne come array NumPy. Le colonne categoriche
+        contengono i codici; i valori corrispondenti sono nelle liste
+        con suffisso "_categories".
+        """
+        check_numpy()
+        return {"host": np.frombuffer(self.host_codes, dtype=np.int32),
+                "host_categories": self.hosts.values,
+                "port": np.frombuffer(self.port_codes, dtype=np.int32),
+                "port_categories": self.ports.values,
+                "threat": np.frombuffer(self.threat_codes, dtype=np.int32),
+                "threat_categories": self.threats.values,
+                "severity": np.frombuffer(self.severity, dtype=np.float64),
+                "qod": np.frombuffer(self.qod, dtype=np.int32),
+                "cvss": np.frombuffer(self.cvss, dtype=np.float64)}
+
+
+def group_statistics(codes, severity, groups, percentiles=PERCENTILES):
+    """
+    Calcola, per ogni gruppo (codice), il numero di risultati, la gravità
+    massima, i percentili della gravità (interpolazione lineare, come
+    numpy.percentile) e l'istogramma della gravità.
+
+    Tutti i gruppi vengono calcolati insieme, ordinando una sola volta
+    i valori per gruppo e gravità. Le gravità NaN sono escluse.
+    """
+    valid = ~np.isnan(severity)
+    codes = codes[valid]
+    severity = severity[valid]
+
+    counts = np.bincount(codes, minlength=groups)
+    order = np.lexsort((severity, codes))
+    ordered = severity[order]
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    last = np.where(present, starts + counts - 1, 0)
+
+    maximum = np.full(groups, np.nan)
+    if ordered.size:
+        maximum[present] = ordered[last[present]]
+
+    values = {}
+    for q in percentiles:
+        position = starts + (counts - 1).clip(min=0) * (q / 100)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        result = np.full(groups, np.nan)
+        if ordered.size:
+            low_values = ordered[low[present]]
+            high_values = ordered[high[present]]
+            fraction = position[present] - low[present]
+            result[present] = low_values + \
+                (high_values - low_values) * fraction
+        values[q] = result
+
+    bins = np.clip(np.floor(severity), 0, SEVERITY_BINS - 1).astype(np.int64)
+    histogram = np.bincount(codes * SEVERITY_BINS + bins,
+                            minlength=groups * SEVERITY_BINS)
+    histogram = histogram.reshape(groups, SEVERITY_BINS)
+
+    return counts, maximum, values, histogram
+
+
+def to_number(value):
+    """
+    Converte un valore NumPy in un numero serializzabile in json
+    (None per NaN)
+    """
+    value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def compute_statistics(columns, percentiles=PERCENTILES) -> dict:
+    """
+    Crea e restituisce un dizionario contenente le statistiche della
+    gravità dei risultati: complessive, per host e per minaccia
+    """
+    severity = columns["severity"]
+    everything = np.zeros(len(severity), dtype=np.int32)
+    statistics = {}
+
+    for name, codes, categories in (
+            ("total", everything, ["total"]),
+            ("hosts", columns["host"], columns["host_categories"]),
+            ("threats", columns["threat"], columns["threat_categories"])):
+        counts, maximum, values, histogram = group_statistics(
+            codes, severity, len(categories), percentiles)
+        statistics[name] = {
+            category: {
+                "count": to_number(counts[i]),
+                "max_severity": to_number(maximum[i]),
+                "percentiles": {str(q): to_number(values[q][i])
+                                for q in percentiles},
+                "histogram": [to_number(x) for x in histogram[i]]}
+            for i, category in enumerate(categories)}
+
+    statistics["total"] = statistics["total"].get("total", {})
+    qod = columns["qod"][columns["qod"] >= 0]
+    statistics["total"]["mean_qod"] = \
+        to_number(qod.mean()) if qod.size else None
+    return statistics
+
+
+class StatsSink(ColumnCollector):
+    """
+    Formato di output contenente soltanto le statistiche dei risultati,
+    con la stessa interfaccia dei formati di result_sinks. Dopo la
+    chiusura le statistiche sono disponibili nell'attributo statistics
+    (si veda print_statistics).
+    """
+    extension = "_stats.json"
+
+    def __init__(self, directory, column_names, compression=None):
+        check_numpy()
+        super().__init__(column_names)
+        self.path = create_temp_file(directory)
+        self.file = open_file(self.path, "w", compression)
+        self.statistics = None
+
+    def close(self, output_file=None):
+        """
+        Calcola le statistiche, le scrive nel file e lo rinomina in
+        output_file; se output_file è None (ad esempio in caso di errori)
+        il file viene eliminato
+        """
+        if output_file is not None:
+            self.statistics = compute_statistics(self.to_arrays())
+            self.file.write(dumps(self.statistics, indent=4))
+        self.file.close()
+        finalize_temp_file(self.path, output_file)
+
+
+def print_statistics(statistics):
+    """
+    Stampa a schermo una tabella riassuntiva delle statistiche per minaccia
+    """
+    print(f"{'threat':<10}{'count':>8}{'max':>7}{'p50':>7}{'p90':>7}")
+    for name, values in [("total", statistics["total"]),
+                         *statistics["threats"].items()]:
+        row = [values.get("max_severity"),
+               values.get("percentiles", {}).get("50"),
+               values.get("percentiles", {}).get("90")]
+        print(f"{str(name):<10}{values.get('count', 0):>8}" +
+              "".join(f"{'-' if x is None else f'{x:.1f}':>7}" for x in row))
@@ -0,0 +1,140 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Contiene una rappresentazione compatta, in memoria, dei risultati prodotti
+da create_result_json: ogni risultato è un oggetto con __slots__ invece di
+un insieme di dizionari, e i valori che si ripetono (host, porte, minacce,
+nvt, descrizioni identiche, ...) vengono memorizzati una sola volta grazie
+ad una tabella di interning.
+"""
+from json_writer import RESULT_LEVEL, serialize
+
+
+class InternTable:
+    """
+    Tabella di interning: restituisce, per ogni valore (hashable), la prima
+    istanza uguale incontrata, in modo che i valori ripetuti condividano
+    la stessa memoria
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def intern(self, value):
+        """
+        Restituisce l'istanza condivisa del valore passato come parametro
+        """
+        return self.values.setdefault(value, value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ResultRecord:
+    """
+    Singolo risultato. I campi nvt, detection e qod sono tuple di coppie
+    (chiave, valore), condivise tra tutti i risultati uguali.
+    """
+    __slots__ = ("port", "nvt", "threat", "severity",
+                 "detection", "qod", "description")
+
+    def __init__(self, port, nvt, threat, severity, detection, qod,
+                 description):
+        self.port = port
+        self.nvt = nvt
+        self.threat = threat
+        self.severity = severity
+        self.detection = detection
+        self.qod = qod
+        self.description = description
+
+    def to_dict(self, column_names) -> dict:
+        """
+        Restituisce il risultato nella forma prodotta da create_result_json
+        """
+        json_element = {}
+        json_element[column_names[0]] = self.port
+        json_element[column_names[1]] = dict(self.nvt)
+        json_element[column_names[2]] = self.threat
+        json_element[column_names[3]] = self.severity
+        if self.detection is not None:
+            json_element[column_names[4]] = dict(self.detection)
+        json_element[column_names[5]] = dict(self.qod)
+        json_element[column_names[6]] = self.description
+        return json_element
+
+
+class RecordCollector:
+    """
+    Raccoglitore dei risultati prodotti da create_result_json (si veda il
+    parametro sink), memorizzati come ResultRecord raggruppati per host.
+    Fornisce le aggregazioni più comuni senza ricostruire i dizionari.
+    """
+
+    def __init__(self, column_names):
+        self.column_names = column_names
+        self.table = InternTable()
+        self.hosts = {}
+
+    def add(self, host, json_element, result=None):
+        """
+        Converte il risultato in un ResultRecord e lo aggiunge a quelli
+        dell'host
+        """
+        intern = self.table.intern
+        names = self.column_names
+        detection = json_element.get(names[4])
+        record = ResultRecord(
+            intern(json_element[names[0]]),
+            intern(tuple(json_element[names[1]].items())),
+            intern(json_element[names[2]]),
+            intern(json_element[names[3]]),
+            None if detection is None else intern(tuple(detection.items())),
+            intern(tuple(json_element[names[5]].items())),
+            intern(json_element[names[6]]))
+        host = intern(host)
+        if host not in self.hosts:
+            self.hosts[host] = []
+        self.hosts[host].append(record)
+
+    def to_dict(self) -> dict:
+        """
+        Restituisce i risultati nella forma prodotta da create_result_json
+        """
+        return {host: [record.to_dict(self.column_names)
+                       for record in records]
+                for host, records in self.hosts.items()}
+
+    def iter_serialized(self, indent):
+        """
+        Generatore che restituisce, per ogni host, la coppia formata
+        dall'host e dal generatore dei relativi risultati serializzati
+        (si veda json_writer.write_report)
+        """
+        for host, records in self.hosts.items():
+            yield host, (serialize(record.to_dict(self.column_names),
+                                   indent, RESULT_LEVEL)
+                         for record in records)
+
+    def close(self):
+        """
+        Libera la memoria occupata dai risultati raccolti
+        """
+        self.hosts.clear()
+        self.table = InternTable()
+
+    def count_by_host(self) -> dict:
+        """
+        Restituisce il numero di risultati per ogni host
+        """
+        return {host: len(records) for host, records in self.hosts.items()}
+
+    def count_by_threat(self) -> dict:
+        """
+        Restituisce il numero di risultati per ogni minaccia
+        """
+        counts = {}
+        for records in self.hosts.values():
+            for record in records:
+                counts[record.threat] = counts.get(record.threat, 0) + 1
+        return counts
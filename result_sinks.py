@@ -0,0 +1,116 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Contiene i formati di output alternativi al report json: ogni risultato
+prodotto da create_result_json viene appiattito in un singolo record
+(host, porta, oid dell'nvt, minaccia, gravità, qod, cve) e scritto
+- in un file json delimitato da newline (un risultato per riga);
+- in un database SQLite indicizzato per host, gravità e oid dell'nvt.
+
+I record vengono scritti in un file temporaneo nella cartella di output,
+che viene rinominato solo al termine dell'elaborazione (si veda
+temp_files). Il file json può essere compresso (si veda compression).
+"""
+from json import dumps
+import sqlite3
+from compression import open_file
+from temp_files import create_temp_file, finalize_temp_file
+
+FLAT_COLUMN_NAMES = ("host", "port", "nvt_oid", "threat",
+                     "severity", "qod", "cve")
+
+
+def flatten_result(host, json_element, result) -> tuple:
+    """
+    Restituisce la tupla dei campi FLAT_COLUMN_NAMES relativi al risultato
+    passato come parametro. L'oid dell'nvt non è presente nel dizionario
+    e viene letto dal nodo result (XML).
+    """
+    nvt = result.find("nvt")
+    return (host,
+            json_element["port"],
+            nvt.attrib.get("oid") if nvt is not None else None,
+            json_element["threat"],
+            json_element["severity"],
+            json_element["qod"].get("value"),
+            json_element["nvt"].get("cve"))
+
+
+class NdjsonSink:
+    """
+    Scrive ogni risultato, appiattito, come oggetto json su una riga
+    """
+    extension = ".ndjson"
+
+    def __init__(self, directory, compression=None):
+        self.path = create_temp_file(directory)
+        self.file = open_file(self.path, "w", compression)
+
+    def add(self, host, json_element, result):
+        """
+        Scrive nel file una riga relativa al risultato
+        """
+        record = dict(zip(FLAT_COLUMN_NAMES,
+                          flatten_result(host, json_element, result)))
+        self.file.write(dumps(record) + "\n")
+
+    def close(self, output_file=None):
+        """
+        Chiude il file e lo rinomina in output_file; se output_file è None
+        (ad esempio in caso di errori) il file viene eliminato
+        """
+        self.file.close()
+        finalize_temp_file(self.path, output_file)
+
+
+class SqliteSink:
+    """
+    Inserisce ogni risultato, appiattito, nella tabella results di un
+    database SQLite. Gli inserimenti vengono eseguiti a blocchi e gli
+    indici creati soltanto alla fine, per velocizzare il caricamento.
+    """
+    extension = ".sqlite"
+    batch_size = 1000
+
+    def __init__(self, directory, compression=None):
+        if compression is not None:
+            raise ValueError("SQLite databases can not be compressed")
+        self.path = create_temp_file(directory)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            "CREATE TABLE results (host TEXT, port TEXT, nvt_oid TEXT, "
+            "threat TEXT, severity REAL, qod INTEGER, cve TEXT)")
+        self.rows = []
+
+    def add(self, host, json_element, result):
+        """
+        Accoda il risultato a quelli da inserire nel database
+        """
+        self.rows.append(flatten_result(host, json_element, result))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Inserisce nel database i risultati accodati
+        """
+        self.connection.executemany(
+            "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?)", self.rows)
+        self.rows.clear()
+
+    def close(self, output_file=None):
+        """
+        Completa il database e lo rinomina in output_file; se output_file
+        è None (ad esempio in caso di errori) il database viene eliminato
+        """
+        if output_file is not None:
+            self.flush()
+            for column in ("host", "severity", "nvt_oid"):
+                self.connection.execute(
+                    f"CREATE INDEX results_{column} ON results ({column})")
+            self.connection.commit()
+        self.connection.close()
+        finalize_temp_file(self.path, output_file)
+
+
+SINKS = {"ndjson": NdjsonSink, "sqlite": SqliteSink}
@@ -0,0 +1,213 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Contiene la codifica a dizionario dei risultati prodotti da
+create_result_json: ogni nvt e ogni descrizione distinti vengono
+memorizzati una sola volta, nelle sezioni "nvts" e "descriptions" del
+report, e i risultati vi fanno riferimento rispettivamente tramite l'oid
+dell'nvt e tramite l'hash della descrizione.
+
+La funzione load_report legge un report codificato e lo restituisce nella
+forma originale, con nvt e descrizioni all'interno dei risultati, mentre
+iter_report_results ne legge i risultati in modo incrementale.
+"""
+from hashlib import blake2b
+from json import load
+from json_stream import JsonStream
+from json_writer import RESULT_COLUMN_NAMES, RESULT_LEVEL, serialize
+from compression import open_file
+
+NVTS_SECTION = "nvts"
+DESCRIPTIONS_SECTION = "descriptions"
+
+
+def get_hash(text) -> str:
+    """
+    Restituisce l'hash (esadecimale, 16 caratteri) del testo
+    """
+    return blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+class TableEncoder:
+    """
+    Raccoglitore dei risultati prodotti da create_result_json (si veda il
+    parametro sink) che sostituisce nvt e descrizione di ogni risultato con
+    la relativa chiave, aggiungendoli alle tabelle se non già presenti.
+
+    I risultati codificati vengono passati al sink indicato (ad esempio
+    un ResultSpool) oppure, se sink è None, raggruppati per host in memoria.
+    """
+
+    def __init__(self, column_names, sink=None):
+        self.column_names = column_names
+        self.sink = sink
+        self.hosts = {}
+        self.nvts = {}
+        self.descriptions = {}
+        # Chiave già assegnata ad ogni nvt e ad ogni descrizione distinti
+        self.nvt_keys = {}
+        self.description_keys = {}
+
+    def get_nvt_key(self, nvt, result) -> str:
+        """
+        Restituisce la chiave dell'nvt, aggiungendolo alla tabella se non
+        già presente. La chiave è l'oid dell'nvt; nel caso (anomalo) di nvt
+        diversi con lo stesso oid viene aggiunto un suffisso numerico.
+        """
+        items = tuple(nvt.items())
+        key = self.nvt_keys.get(items)
+        if key is not None:
+            return key
+        node = result.find("nvt") if result is not None else None
+        oid = (node.attrib.get("oid") if node is not None else None) or \
+            get_hash(repr(items))
+        key = oid
+        suffix = 1
+        while key in self.nvts:
+            key = f"{oid}-{suffix}"
+            suffix += 1
+        self.nvt_keys[items] = key
+        self.nvts[key] = nvt
+        return key
+
+    def get_description_key(self, description):
+        """
+        Restituisce la chiave della descrizione, aggiungendola alla tabella
+        se non già presente. La chiave è l'hash della descrizione; le
+        descrizioni vuote (None) non vengono codificate.
+        """
+        if description is None:
+            return None
+        key = self.description_keys.get(description)
+        if key is not None:
+            return key
+        # In caso di collisione dell'hash viene aggiunto un suffisso
+        key = digest = get_hash(description)
+        suffix = 1
+        while key in self.descriptions:
+            key = f"{digest}-{suffix}"
+            suffix += 1
+        self.description_keys[description] = key
+        self.descriptions[key] = description
+        return key
+
+    def add(self, host, json_element, result=None):
+        """
+        Codifica il risultato e lo passa al sink o lo aggiunge a quelli
+        dell'host
+        """
+        names = self.column_names
+        json_element[names[1]] = self.get_nvt_key(json_element[names[1]],
+                                                  result)
+        json_element[names[6]] = self.get_description_key(
+            json_element[names[6]])
+        if self.sink is not None:
+            self.sink.add(host, json_element, result)
+            return
+        if host not in self.hosts:
+            self.hosts[host] = []
+        self.hosts[host].append(json_element)
+
+    def iter_serialized(self, indent):
+        """
+        Generatore che restituisce, per ogni host, la coppia formata
+        dall'host e dal generatore dei relativi risultati serializzati
+        (si veda json_writer.write_report)
+        """
+        if self.sink is not None:
+            yield from self.sink.iter_serialized(indent)
+            return
+        for host, elements in self.hosts.items():
+            yield host, (serialize(element, indent, RESULT_LEVEL)
+                         for element in elements)
+
+    def get_tables(self) -> dict:
+        """
+        Restituisce le sezioni del report contenenti le tabelle
+        degli nvt e delle descrizioni
+        """
+        return {NVTS_SECTION: self.nvts,
+                DESCRIPTIONS_SECTION: self.descriptions}
+
+    def close(self):
+        """
+        Chiude il sink e libera la memoria occupata dai risultati
+        """
+        if self.sink is not None:
+            self.sink.close()
+        self.hosts.clear()
+
+
+def decode_results(results, nvts, descriptions, column_names):
+    """
+    Sostituisce, in ogni risultato, le chiavi dell'nvt e della descrizione
+    con i relativi valori, letti dalle tabelle
+    """
+    nvt_name, description_name = column_names[1], column_names[6]
+    for elements in results.values():
+        for element in elements:
+            element[nvt_name] = dict(nvts[element[nvt_name]])
+            description = element[description_name]
+            if description is not None:
+                element[description_name] = descriptions[description]
+
+
+def load_report(input_file, column_names=RESULT_COLUMN_NAMES) -> dict:
+    """
+    Legge il report in formato json (eventualmente compresso) e lo
+    restituisce. Se il report contiene le tabelle degli nvt e delle
+    descrizioni, i risultati vengono riportati alla forma originale e le
+    tabelle rimosse.
+    """
+    with open_file(input_file) as f:
+        report = load(f)
+    if NVTS_SECTION in report:
+        nvts = report.pop(NVTS_SECTION)
+        descriptions = report.pop(DESCRIPTIONS_SECTION, {})
+        decode_results(report.get("results", {}), nvts, descriptions,
+                       column_names)
+    return report
+
+
+def iter_report_results(input_file, sections=None,
+                        column_names=RESULT_COLUMN_NAMES):
+    """
+    Generatore che legge in modo incrementale (si veda json_stream) il
+    report in formato json, eventualmente compresso, e restituisce per
+    ogni risultato la tripla (host, risultato, nvt). Ogni risultato viene
+    decodificato per intero (descrizione e tags compresi, dato che
+    decodificarlo in un'unica operazione è più veloce che saltarne i
+    campi uno alla volta) e può essere scartato dopo l'uso.
+
+    nvt è il dizionario dell'nvt oppure, se il risultato fa riferimento
+    alla tabella degli nvt e questa non è ancora stata letta, la relativa
+    chiave: la tabella segue i risultati nel report, e al termine della
+    lettura è disponibile in sections[NVTS_SECTION].
+
+    Le sezioni il cui nome è una chiave del dizionario sections vengono
+    memorizzate nel dizionario stesso; le altre vengono saltate senza
+    essere costruite.
+    """
+    if sections is None:
+        sections = {}
+    nvt_name = column_names[1]
+    nvts = None
+    with open_file(input_file) as f:
+        stream = JsonStream(f)
+        for section in stream.iter_object():
+            if section == "results":
+                for host in stream.iter_object():
+                    for _ in stream.iter_array():
+                        element = stream.read_value()
+                        nvt = element.get(nvt_name)
+                        if nvts is not None and not isinstance(nvt, dict):
+                            nvt = nvts.get(nvt, {})
+                        yield host, element, nvt
+            elif section == NVTS_SECTION:
+                nvts = {key: stream.read_value()
+                        for key in stream.iter_object()}
+                sections[NVTS_SECTION] = nvts
+            elif section in sections:
+                sections[section] = stream.read_value()
+            else:
+                stream.skip_value()
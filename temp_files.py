@@ -0,0 +1,41 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Contiene la scrittura dei file di output tramite file temporanei: il
+file viene creato nella cartella di output e rinominato nel file di
+output solo al termine dell'elaborazione, per cui chi lo legge (o un
+altro processo che scrive lo stesso file) non vede mai un file
+incompleto.
+"""
+from os import chmod, close, remove, replace, umask
+from tempfile import mkstemp
+
+# Umask del processo, letta una sola volta all'importazione del modulo:
+# la lettura richiede di modificarla temporaneamente, per cui non può
+# essere ripetuta mentre altri thread creano file
+UMASK = umask(0)
+umask(UMASK)
+
+
+def create_temp_file(directory) -> str:
+    """
+    Crea un file temporaneo vuoto nella cartella indicata e ne restituisce
+    il nome
+    """
+    fd, path = mkstemp(dir=directory, suffix=".tmp")
+    close(fd)
+    return path
+
+
+def finalize_temp_file(path, output_file=None):
+    """
+    Rinomina il file temporaneo in output_file, con i permessi di un file
+    creato normalmente (mkstemp lo crea leggibile dal solo proprietario);
+    se output_file è None (ad esempio in caso di errori) il file viene
+    eliminato
+    """
+    if output_file is None:
+        remove(path)
+    else:
+        chmod(path, 0o666 & ~UMASK)
+        replace(path, output_file)
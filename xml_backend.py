@@ -0,0 +1,165 @@
+"""
+Questo è un modulo di supporto per lo script xml_parser.py
+
+Fornisce le operazioni sull'albero XML utilizzate da xml_parser.py
+(parse, iterparse, fromstring, Element) attraverso due implementazioni:
+- lxml, più veloce, utilizzata automaticamente se installata;
+- xml.etree.ElementTree della libreria standard, altrimenti.
+
+Entrambe producono nodi con la stessa interfaccia (indicizzazione, len,
+tag, text, attrib, itertext), per cui l'output è identico. Anche gli
+errori di sintassi vengono segnalati in entrambi i casi con
+xml.etree.ElementTree.ParseError.
+"""
+from xml.etree import ElementTree
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+BACKENDS = ("auto", "lxml", "etree")
+
+
+def iter_result_nodes(context):
+    """
+    Generatore che, a partire da un iterparse con eventi "start" ed "end",
+    restituisce ogni nodo result (XML) figlio del nodo results non appena
+    viene letto il relativo tag di chiusura.
+
+    Una volta elaborato, il nodo viene rimosso dall'albero in modo che
+    la memoria occupata non cresca con la dimensione del report.
+    """
+    path = []
+    for event, element in context:
+        if event == "start":
+            path.append(element)
+            continue
+        path.pop()
+
+        # I nodi result annidati (ad esempio in detection) vengono ignorati
+        if element.tag == "result" and path and path[-1].tag == "results":
+            yield element
+            path[-1].remove(element)
+
+
+class EtreeBackend:
+    """
+    Implementazione basata su xml.etree.ElementTree
+    """
+    name = "etree"
+    Element = ElementTree.Element
+
+    @staticmethod
+    def parse(source):
+        return ElementTree.parse(source)
+
+    @staticmethod
+    def fromstring(data):
+        return ElementTree.fromstring(data)
+
+    @staticmethod
+    def iterparse(source, events):
+        return ElementTree.iterparse(source, events=events)
+
+    @staticmethod
+    def stream_results(source):
+        """
+        Restituisce la coppia (iterparse, generatore dei nodi result) per
+        la lettura in modalità streaming; al termine della lettura il nodo
+        radice è disponibile nell'attributo root dell'iterparse
+        """
+        context = ElementTree.iterparse(source, events=("start", "end"))
+        return context, iter_result_nodes(context)
+
+
+def to_parse_error(error):
+    """
+    Converte un errore di sintassi di lxml in un ParseError di
+    xml.etree.ElementTree, che a differenza del primo può essere
+    trasferito tra processi (ad esempio da un ProcessPoolExecutor)
+    """
+    parse_error = ElementTree.ParseError(str(error))
+    parse_error.position = error.position
+    return parse_error
+
+
+class LxmlBackend:
+    """
+    Implementazione basata su lxml. Commenti e processing instruction
+    vengono scartati, in modo che gli indici dei sotto-nodi coincidano
+    con quelli di xml.etree.ElementTree.
+
+    huge_tree rimuove i limiti di libxml2 sulla dimensione dei nodi, ma
+    anche la protezione dall'espansione ricorsiva delle entità: le entità
+    dichiarate nel documento non vengono quindi espanse, dato che i
+    report possono provenire da una cartella sorvegliata (si veda
+    report_watcher.py) e i report di OpenVAS non ne contengono.
+    """
+    name = "lxml"
+
+    def __init__(self):
+        self.parser = etree.XMLParser(remove_comments=True, remove_pis=True,
+                                      huge_tree=True, resolve_entities=False)
+        self.Element = etree.Element
+
+    def parse(self, source):
+        try:
+            return etree.parse(source, self.parser)
+        except etree.XMLSyntaxError as e:
+            raise to_parse_error(e) from None
+
+    def fromstring(self, data):
+        try:
+            return etree.fromstring(data, self.parser)
+        except etree.XMLSyntaxError as e:
+            raise to_parse_error(e) from None
+
+    @staticmethod
+    def iterparse(source, events):
+        return etree.iterparse(source, events=events, remove_comments=True,
+                               remove_pis=True, huge_tree=True,
+                               resolve_entities=False)
+
+    @staticmethod
+    def stream_results(source):
+        """
+        Restituisce la coppia (iterparse, generatore dei nodi result) per
+        la lettura in modalità streaming. lxml filtra gli eventi per tag
+        e fornisce il nodo padre, per cui vengono ricevuti soltanto gli
+        eventi di chiusura dei nodi result.
+        """
+        context = etree.iterparse(source, events=("end",), tag="result",
+                                  remove_comments=True, remove_pis=True,
+                                  huge_tree=True, resolve_entities=False)
+
+        def result_nodes():
+            try:
+                for _, element in context:
+                    parent = element.getparent()
+
+                    # I nodi result annidati (ad esempio in detection)
+                    # vengono ignorati
+                    if parent is not None and parent.tag == "results":
+                        yield element
+                        parent.remove(element)
+            except etree.XMLSyntaxError as e:
+                raise to_parse_error(e) from None
+
+        return context, result_nodes()
+
+
+def get_backend(name="auto"):
+    """
+    Restituisce l'implementazione richiesta: con "auto" (o None) lxml se
+    installata, xml.etree.ElementTree altrimenti
+    """
+    if name in (None, "auto"):
+        name = "lxml" if etree is not None else "etree"
+    if name == "lxml":
+        if etree is None:
+            raise ImportError("lxml is not installed (pip install lxml)")
+        return LxmlBackend()
+    if name == "etree":
+        return EtreeBackend()
+    raise ValueError(f"Unknown XML backend: {name}")
@@ -2,12 +2,32 @@
 Questo modulo si occupa di filtrare il report in formato XML generato
 dallascansione del target ottenuto dall'esecuzione di interact.py
 """
-from xml.etree.ElementTree import parse
-from os.path import dirname
+from os.path import dirname, join, basename
 from argparse import ArgumentParser
 from datetime import datetime
-from json import dumps
 from re import compile
+from glob import glob
+from sys import exit, stderr
+from time import perf_counter
+from multiprocessing import cpu_count
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import repeat
+from report_index import load_index, build_partial_report, SectionReader, \
+    read_section, split_results
+from json_writer import RESULT_COLUMN_NAMES, RESULT_LEVEL, ResultSpool, \
+    SerializedResults, serialize, write_report
+from result_sinks import SINKS
+from result_records import RecordCollector
+from result_columns import StatsSink, print_statistics
+from result_tables import TableEncoder
+from temp_files import create_temp_file, finalize_temp_file
+from host_assets import create_asset_index
+from nvt_tags import NvtTags
+from profiler import Profiler, profile
+from parse_cache import ParseCache, get_cache_key, DEFAULT_CACHE_DIR
+from xml_backend import BACKENDS, get_backend
+from compression import COMPRESSIONS, get_compression, \
+    get_compression_suffix, open_file
 
 
 def get_parser():
@@ -43,14 +63,138 @@ def get_parser():
         help='Add results count to the report')
     parser.add_argument('--details', action='store_true',
         help='Add details to the report')
+    parser.add_argument('--assets', action='store_true',
+        help='Add the per-host asset index (OS, apps, SSL certificates '
+             'and details of every host, by IP) to the report')
     parser.add_argument('--errors', action='store_true',
         help='Add errors to the report')
-    parser.add_argument('--input', required=True,
+    parser.add_argument('--scan', action='store_true',
+        help='Add the scan identification (report and task ids, '
+             'timestamp and scanned hosts) to the report, as used by '
+             'the CVE index')
+    parser.add_argument('--stream', action='store_true',
+        help='Parse results incrementally and spool them to disk (as '
+             'with --incremental), keeping memory usage flat. Not '
+             'combined with --parallel, whose results stay in memory')
+    parser.add_argument('--index', action='store_true',
+        help='Use (and create if needed) a byte-offset index of the '
+             'report sections, reading only the requested ones. Ignored '
+             'for compressed reports')
+    parser.add_argument('--incremental', action='store_true',
+        help='Write each result to disk as soon as it is produced')
+    parser.add_argument('--interned', action='store_true',
+        help='Keep results in memory as compact records sharing '
+             'repeated values')
+    parser.add_argument('--compact', action='store_true',
+        help='Write the report without indentation')
+    parser.add_argument('--format', default='json',
+        choices=['json'] + list(SINKS),
+        help='Output format. ndjson and sqlite contain only the results, '
+             'one flattened record per result (default: json)')
+    parser.add_argument('--dedup', action='store_true',
+        help='Store each distinct NVT and description once, in the "nvts" '
+             'and "descriptions" sections, and refer to them from the '
+             'results by OID and hash (see result_tables.load_report)')
+    parser.add_argument('--compress', choices=list(COMPRESSIONS),
+        help='Compress the output file with gzip (gz) or xz. Compressed '
+             'reports (.xml.gz, .xml.xz) are always read transparently')
+    parser.add_argument('--min-severity', type=float,
+        help='Keep only the results with at least this severity')
+    parser.add_argument('--threat', nargs='+',
+        help='Keep only the results with one of these threat levels '
+             '(e.g. High Medium)')
+    parser.add_argument('--host', nargs='+',
+        help='Keep only the results of these hosts')
+    parser.add_argument('--nvt-family', nargs='+',
+        help='Keep only the results whose NVT belongs to one of these '
+             'families')
+    parser.add_argument('--stats', action='store_true',
+        help='Write per-host and per-threat severity statistics '
+             '(requires NumPy)')
+    parser.add_argument('--profile', nargs='?', const='table',
+        choices=['table', 'json'],
+        help='Measure wall time, CPU time, peak Python heap and peak RSS '
+             'increase of every phase and print them as a table (default) '
+             'or as json. Disables the cache; memory tracing slows down '
+             'the execution')
+    parser.add_argument('--no-cache', action='store_true',
+        help='Do not use the cache of already processed reports')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+        help=f'Cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-size', type=int, default=512,
+        help='Maximum size of the cache in MB (default: 512)')
+    parser.add_argument('--pattern', default='*.xml',
+        help='Glob pattern of the reports in --input-dir (default: *.xml)')
+    parser.add_argument('--backend', choices=BACKENDS, default='auto',
+        help='XML parser: lxml if installed (default: auto), lxml or the '
+             'standard library (etree); the output does not change')
+    parser.add_argument('--parallel', action='store_true',
+        help='Split the results section into chunks converted by a pool '
+             'of --workers processes, using the byte-offset index. Only '
+             'for uncompressed reports and json output without '
+             '--incremental, --interned and --dedup')
+    parser.add_argument('--workers', type=int,
+        help='Number of processes used with --input-dir or --parallel '
+             '(default: number of CPUs)')
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument('--input',
         help='Input file')
+    input_group.add_argument('--input-dir',
+        help='Process every report in this directory')
 
     return parser
 
 
+# Sotto-nodi di ogni result (XML) da cui vengono estratti i campi
+RESULT_PLAN_TAGS = ("host", "port", "nvt", "threat", "severity",
+                    "detection", "qod", "description")
+
+# Sotto-nodi (XML) del report necessari per ogni parametro in input
+REPORT_SECTION_TAGS = {
+    "hosts_number": ("hosts",),
+    "vulns_number": ("vulns",),
+    "os_number": ("os",),
+    "apps": ("apps",),
+    "ssl_certs": ("ssl_certs",),
+    "timestamp": ("timestamp", "timezone", "timezone_abbrev"),
+    "tasks": ("task",),
+    "ports": ("ports",),
+    "results": ("results",),
+    "results_count": ("result_count", "severity"),
+    "details": ("host",),
+    "assets": ("host",),
+    "errors": ("errors",),
+    "scan": ("timestamp", "host"),
+}
+
+# Numero di intervalli della sezione results per ogni processo con
+# --parallel: intervalli più piccoli bilanciano meglio il carico
+CHUNKS_PER_WORKER = 4
+
+# Parametri in input che determinano il contenuto del file di output,
+# utilizzati per calcolare la chiave di cache
+OUTPUT_OPTIONS = ("all", "owner", *REPORT_SECTION_TAGS, "format", "compact",
+                  "stats", "compress", "dedup", "min_severity", "threat",
+                  "host", "nvt_family")
+
+
+def get_section_tags(to_add):
+    """
+    Restituisce gli insiemi dei sotto-nodi del report generico e del
+    report (XML) da leggere per soddisfare i parametri in input.
+    Il nodo task è sempre incluso perché necessario al nome del file
+    di output.
+    """
+    if "all" in to_add:
+        return {"owner"}, {tag for tags in REPORT_SECTION_TAGS.values()
+                           for tag in tags}
+    general_tags = {"owner"} if "owner" in to_add else set()
+    report_tags = {"task"}
+    for name in to_add:
+        report_tags.update(REPORT_SECTION_TAGS.get(name, ()))
+    return general_tags, report_tags
+
+
 def get_indexes(root) -> dict:
     """
     Restituisce un dizionario contenente un'indicizzazione della
@@ -127,7 +271,78 @@ def create_ports_json(ports, column_names) -> dict:
     return json_ports
 
 
-def create_result_json(results, column_names) -> dict:
+def compile_result_plan(result) -> tuple:
+    """
+    Crea e restituisce il piano di estrazione dei campi di un nodo
+    result (XML): la coppia formata dalla tupla degli indici dei
+    sotto-nodi RESULT_PLAN_TAGS (None se il sotto-nodo non è presente)
+    e dal numero di sotto-nodi.
+
+    Il piano viene riutilizzato per tutti i result con la stessa forma,
+    evitando di ricalcolare gli indici con get_indexes per ognuno.
+    """
+    result_indexes = get_indexes(result)
+    return tuple(result_indexes.get(tag) for tag in RESULT_PLAN_TAGS), \
+        len(result)
+
+
+def matches_result_plan(result, plan) -> bool:
+    """
+    Restituisce True se il nodo result (XML) ha la forma descritta dal
+    piano: stesso numero di sotto-nodi e sotto-nodi RESULT_PLAN_TAGS
+    nelle stesse posizioni. La presenza di detection aggiunge un
+    sotto-nodo, per cui i result con e senza detection hanno piani diversi.
+    """
+    indexes, length = plan
+    if len(result) != length:
+        return False
+    for tag, index in zip(RESULT_PLAN_TAGS, indexes):
+        if index is not None and result[index].tag != tag:
+            return False
+    return True
+
+
+def get_result_filter(args):
+    """
+    Restituisce il filtro dei risultati richiesto dai parametri in input:
+    la tupla (gravità minima, minacce, host, famiglie degli nvt), in cui
+    ogni elemento è None se il relativo filtro non è richiesto.
+    Restituisce None se non è richiesto alcun filtro.
+    """
+    result_filter = (args.get("min_severity"),
+                     {x.lower() for x in args.get("threat") or ()} or None,
+                     set(args.get("host") or ()) or None,
+                     {x.lower() for x in args.get("nvt_family") or ()} or None)
+    if all(x is None for x in result_filter):
+        return None
+    return result_filter
+
+
+def matches_result_filter(result_filter, host, threat, severity, nvt) -> bool:
+    """
+    Restituisce True se il risultato, descritto dai testi dei sotto-nodi
+    host, threat e severity e dal sotto-nodo nvt (XML), soddisfa il
+    filtro. La famiglia dell'nvt viene letta solo se necessario.
+    """
+    min_severity, threats, hosts, families = result_filter
+    if hosts is not None and host not in hosts:
+        return False
+    if threats is not None and (threat or "").lower() not in threats:
+        return False
+    if min_severity is not None:
+        try:
+            if float(severity) < min_severity:
+                return False
+        except (TypeError, ValueError):
+            return False
+    if families is not None and \
+            (nvt.findtext("family") or "").lower() not in families:
+        return False
+    return True
+
+
+def create_result_json(results, column_names, sink=None,
+                       result_filter=None) -> dict:
     """
     Crea e restituisce un dizionario contenente le informazioni
     riguardanti il contenuto del nodo results (XML).
@@ -139,6 +354,19 @@ def create_result_json(results, column_names) -> dict:
     - detection (risultato della scansione)
     - qod (Quality of Detection [0 - 100]%)
     - description (descrizione)
+
+    Il campo tags dell'nvt è un NvtTags: la stringa originale, le cui
+    coppie nome - valore (ad esempio il vettore CVSS) vengono decodificate
+    al primo accesso.
+
+    Se sink non è None, ogni risultato viene passato, insieme al relativo
+    host e al nodo result (XML), al metodo add di sink (ad esempio un
+    ResultSpool) invece di essere inserito nel dizionario; in tal caso
+    viene restituito sink.
+
+    Se result_filter non è None (si veda get_result_filter), i risultati
+    che non lo soddisfano vengono scartati prima di convertire i relativi
+    sotto-nodi.
     """
 
     def filter_detection(detection):
@@ -173,38 +401,60 @@ def create_result_json(results, column_names) -> dict:
         return dictionary
 
     # Crea il dizionario da restitire in output
-    json_results = {}
+    json_results = {} if sink is None else sink
+
+    # Piani di estrazione già compilati, per numero di sotto-nodi
+    plans = {}
 
     # Per ogni elemento presente nel nodo results (XML):
     for result in results:
 
-        # Ottieni gli indici
-        result_indexes = get_indexes(result)
+        # Ottieni gli indici dal piano compilato per i result con la
+        # stessa forma; se la forma è diversa compila un nuovo piano
+        plan = plans.get(len(result))
+        if plan is None or not matches_result_plan(result, plan):
+            plan = compile_result_plan(result)
+            plans[len(result)] = plan
+        host_index, port_index, nvt_index, threat_index, severity_index, \
+            detection_index, qod_index, description_index = plan[0]
+
+        # Ottieni dall'elemento i campi:
+        # host, port, nvt, threat, severity
+        host = result[host_index].text
+        nvt = result[nvt_index]
+        threat = result[threat_index].text
+        severity = result[severity_index].text
+
+        # Scarta il risultato, se non soddisfa il filtro, prima di
+        # convertire i sotto-nodi nvt, qod, detection e description
+        if result_filter is not None and not matches_result_filter(
+                result_filter, host, threat, severity, nvt):
+            continue
+
         contains_detection = False
         detect_filtered = {}
 
         # Controlla se esiste il campo detection e, se si,
         # aggiungilo all'output
-        if "detection" in result_indexes:
+        if detection_index is not None:
             contains_detection = True
-            detection = result[result_indexes["detection"]]
+            detection = result[detection_index]
             detect_filtered = filter_detection(detection)
 
-        # Ottieni dall'elemento i campi:
-        # host, port, nvt, threat, severity, qod, descrizione
-        host = result[result_indexes["host"]].text
-        port = result[result_indexes["port"]].text
-        nvt = result[result_indexes["nvt"]]
-        threat = result[result_indexes["threat"]].text
-        severity = result[result_indexes["severity"]].text
-        qod = result[result_indexes["qod"]]
-        description = result[result_indexes["description"]].text
+        # Ottieni dall'elemento i campi: port, qod, descrizione
+        port = result[port_index].text
+        qod = result[qod_index]
+        description = result[description_index].text
         nvt_filtered = get_tag_and_text_in_xml_tag(nvt)
         qod_filtered = get_tag_and_text_in_xml_tag(qod)
 
+        # Il campo tags viene decodificato soltanto se utilizzato
+        # (si veda nvt_tags.NvtTags)
+        tags = nvt_filtered.get("tags")
+        if tags is not None:
+            nvt_filtered["tags"] = NvtTags(tags)
+
         # Aggiungi al dizionario da restituire in output i campi ottenuti.
-        if host not in json_results:
-            json_results[host] = []
         json_element = {}
         json_element[column_names[0]] = port
         json_element[column_names[1]] = nvt_filtered
@@ -214,11 +464,64 @@ def create_result_json(results, column_names) -> dict:
             json_element[column_names[4]] = detect_filtered
         json_element[column_names[5]] = qod_filtered
         json_element[column_names[6]] = description
+        if sink is not None:
+            sink.add(host, json_element, result)
+            continue
+        if host not in json_results:
+            json_results[host] = []
         json_results[host].append(json_element)
 
     return json_results
 
 
+def convert_results_chunk(input_file, byte_range, args) -> dict:
+    """
+    Converte, in un processo del pool, i nodi result contenuti
+    nell'intervallo di byte indicato (si veda report_index.split_results).
+
+    Restituisce un dizionario contenente, per ogni host, la lista dei
+    relativi risultati già serializzati in json, così che anche la
+    serializzazione avvenga in parallelo.
+    """
+    backend = get_backend(args.get("backend"))
+    indent = None if args.get("compact") else 4
+    with open(input_file, "rb") as f:
+        results = backend.fromstring(
+            b"<results>" + read_section(f, byte_range) + b"</results>")
+    json_results = create_result_json(results, RESULT_COLUMN_NAMES, None,
+                                      get_result_filter(args))
+    return {host: [serialize(element, indent, RESULT_LEVEL)
+                   for element in elements]
+            for host, elements in json_results.items()}
+
+
+def create_result_json_parallel(input_file, byte_range, args,
+                                max_workers=None) -> SerializedResults:
+    """
+    Converte i risultati della sezione results indicata dall'intervallo
+    di byte e li restituisce, serializzati e raggruppati per host, in un
+    SerializedResults (si veda json_writer.write_report).
+
+    La sezione viene divisa in intervalli allineati ai nodi result,
+    convertiti in parallelo da un pool di processi; le liste di ogni host
+    vengono poi unite nell'ordine del documento.
+    """
+    max_workers = max_workers or cpu_count()
+    with open(input_file, "rb") as f:
+        chunks = split_results(f, byte_range,
+                               max_workers * CHUNKS_PER_WORKER)
+
+    json_results = SerializedResults(None if args.get("compact") else 4)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # map restituisce i risultati nell'ordine degli intervalli
+        for chunk_results in executor.map(convert_results_chunk,
+                                          repeat(input_file), chunks,
+                                          repeat(args)):
+            for host, elements in chunk_results.items():
+                json_results.extend(host, elements)
+    return json_results
+
+
 def create_results_count_json(results_count) -> dict:
     """
     Crea e restituisce un dizionario contenente le informazioni
@@ -239,18 +542,20 @@ def create_results_count_json(results_count) -> dict:
 def create_host_detailed_vulns_list(details, column_names) -> list:
     """
     Crea e restituisce un dizionario contenente le informazioni
-    riguardanti il contenuto del nodo details (XML).
+    riguardanti il contenuto del nodo details (XML), cioè un nodo host.
     I campi filtrati sono:
+    - host (indirizzo IP dell'host a cui si riferisce il dettaglio)
     - name (nome)
     - value (valore)
     - source (sorgente)
     - extra (dettagli aggiuntivi)
     """
     host_detailed_vulns = []
+    host = details.findtext("ip")
 
-    # Per ogni elemento presente nel nodo details (XML):
-    for detail in details[6:]:
-        json_element = {}
+    # Per ogni sotto-nodo detail presente nel nodo details (XML):
+    for detail in details.findall("detail"):
+        json_element = {"host": host}
 
         # Ottieni nome e valore dall'elemento e filtra quelli da scartare
         name, value = detail[0].text, detail[1].text
@@ -316,11 +621,28 @@ def create_errors_json(errors) -> dict:
     return json_errors
 
 
-def make_update_dict(to_add):
+def make_update_dict(to_add, general_report, report,
+                     streamed_results=None, sink=None, profiler=None,
+                     result_filter=None):
     """
     Filtra e restituisci, tra i parametri di input, quelli che
     devono essere aggiunti al file di output.
+
+    Se streamed_results non è None, contiene i risultati già convertiti
+    durante la lettura in modalità streaming. Se sink non è None, i
+    risultati vengono passati a sink e scartati se non soddisfano
+    result_filter (si veda create_result_json).
+    Se profiler non è None, la creazione di ogni sezione viene misurata.
     """
+    general_report_indexes = get_indexes(general_report)
+    report_indexes = get_indexes(report)
+
+    def get_hosts():
+        """
+        Restituisci la lista di tutti i sotto-nodi host (uno per ogni
+        host scansionato), nell'ordine del documento
+        """
+        return [node for node in report if node.tag == "host"]
 
     def get_owner():
         """
@@ -406,15 +728,31 @@ def make_update_dict(to_add):
         return {ports.tag:
                     create_ports_json(ports[1:], port_column_names)}
 
+    def get_scan():
+        """
+        Filtra e restituisci un dizionario contenente le informazioni che
+        identificano la scansione a cui si riferiscono i risultati: id del
+        report e del task, data (nel formato del report XML) e indirizzi
+        IP di tutti gli host scansionati, anche quelli senza risultati
+        """
+        task = report[report_indexes["task"]]
+        return {"scan": {"report_id": general_report.attrib.get("id"),
+                         "task_id": task.attrib.get("id"),
+                         "timestamp": report.findtext("timestamp"),
+                         "hosts": [host.findtext("ip")
+                                   for host in get_hosts()]}}
+
     def get_results():
         """
         Filtra e restituisci un dizionario contenente il sotto-nodo results
         """
         # info(f"adding results to the report.")
         results = report[report_indexes["results"]]
-        result_column_names = ["port", "nvt", "threat", "severity",
-                               "detection", "qod", "description"]
-        return {results.tag: create_result_json(results, result_column_names)}
+        if streamed_results is not None:
+            return {results.tag: streamed_results}
+        return {results.tag:
+                    create_result_json(results, RESULT_COLUMN_NAMES, sink,
+                                       result_filter)}
 
     def get_results_count():
         """
@@ -431,16 +769,23 @@ def make_update_dict(to_add):
 
     def get_details():
         """
-        Filtra e restituisci un dizionario contenente il sotto-nodo details
+        Filtra e restituisci un dizionario contenente i dettagli di tutti
+        i sotto-nodi host, ognuno con l'indirizzo IP del relativo host
         """
         # info(f"adding details to the report.")
-        try:
-            details = report[report_indexes["host"]]
-            detail_column_names = ["name", "value", "source", "extra"]
-            return {"vuln_details": create_host_detailed_vulns_list(
-                                        details, detail_column_names)}
-        except:
-            return {"vuln_details": []}
+        detail_column_names = ["name", "value", "source", "extra"]
+        vuln_details = []
+        for details in get_hosts():
+            vuln_details.extend(create_host_detailed_vulns_list(
+                details, detail_column_names))
+        return {"vuln_details": vuln_details}
+
+    def get_assets():
+        """
+        Filtra e restituisci un dizionario contenente l'indice degli asset
+        di tutti i sotto-nodi host
+        """
+        return {"assets": create_asset_index(get_hosts())}
 
     def get_errors():
         """
@@ -452,41 +797,57 @@ def make_update_dict(to_add):
 
     to_return = {}
 
+    def add(get_section):
+        """
+        Aggiunge all'output la sezione restituita da get_section,
+        misurandone la creazione se richiesto
+        """
+        if profiler is None:
+            to_return.update(get_section())
+            return
+        with profiler.measure(get_section.__name__[len("get_"):]):
+            to_return.update(get_section())
+
     if "all" in to_add:
         # info(f"adding everything to the report.")
-        to_return.update(get_owner())
-        to_return.update(get_hosts_number())
-        to_return.update(get_vulns_number())
-        to_return.update(get_os_number())
-        to_return.update(get_apps_number())
-        to_return.update(get_ssl_certs_number())
-        to_return.update(get_timestamp())
-        to_return.update(get_task())
-        to_return.update(get_ports())
-        to_return.update(get_results())
-        to_return.update(get_results_count())
-        to_return.update(get_details())
-        to_return.update(get_errors())
+        add(get_owner)
+        add(get_hosts_number)
+        add(get_vulns_number)
+        add(get_os_number)
+        add(get_apps_number)
+        add(get_ssl_certs_number)
+        add(get_timestamp)
+        add(get_task)
+        add(get_ports)
+        add(get_scan)
+        add(get_results)
+        add(get_results_count)
+        add(get_details)
+        add(get_assets)
+        add(get_errors)
         return to_return
 
-    if "owner" in to_add: to_return.update(get_owner())
-    if "hosts_number" in to_add: to_return.update(get_hosts_number())
-    if "vulns_number" in to_add: to_return.update(get_vulns_number())
-    if "os_number" in to_add: to_return.update(get_os_number())
-    if "apps" in to_add: to_return.update(get_apps_number())
-    if "ssl_certs" in to_add: to_return.update(get_ssl_certs_number())
-    if "timestamp" in to_add: to_return.update(get_timestamp())
-    if "tasks" in to_add: to_return.update(get_task())
-    if "ports" in to_add: to_return.update(get_ports())
-    if "results" in to_add: to_return.update(get_results())
-    if "results_count" in to_add: to_return.update(get_results_count())
-    if "details" in to_add: to_return.update(get_details())
-    if "errors" in to_add: to_return.update(get_errors())
+    if "owner" in to_add: add(get_owner)
+    if "hosts_number" in to_add: add(get_hosts_number)
+    if "vulns_number" in to_add: add(get_vulns_number)
+    if "os_number" in to_add: add(get_os_number)
+    if "apps" in to_add: add(get_apps_number)
+    if "ssl_certs" in to_add: add(get_ssl_certs_number)
+    if "timestamp" in to_add: add(get_timestamp)
+    if "tasks" in to_add: add(get_task)
+    if "ports" in to_add: add(get_ports)
+    if "scan" in to_add: add(get_scan)
+    if "results" in to_add: add(get_results)
+    if "results_count" in to_add: add(get_results_count)
+    if "details" in to_add: add(get_details)
+    if "assets" in to_add: add(get_assets)
+    if "errors" in to_add: add(get_errors)
 
     return to_return
 
 
-def create_report_json(args):
+def create_report_json(args, general_report, report,
+                       streamed_results=None, sink=None, profiler=None):
     """
     Crea e restituisce un dizionario contenente le informazioni riguardanti
     il contenuto dei nodi filtrati da make_update_dict.
@@ -496,47 +857,390 @@ def create_report_json(args):
     for k, v in args.items():
         if v:
             to_add.append(k)
-    json_report.update(make_update_dict(to_add))
+    json_report.update(make_update_dict(to_add, general_report, report,
+                                        streamed_results, sink, profiler,
+                                        get_result_filter(args)))
     return json_report
 
 
-def write_report_to_file(report, output_file):
+def read_report(input_file, args, sink=None):
+    """
+    Legge il file di input e restituisce la tripla formata dai nodi
+    riguardanti il report generico e il report (XML) e dai risultati
+    già convertiti in modalità streaming (None altrimenti).
+
+    In modalità streaming i nodi result vengono convertiti man mano che
+    vengono letti e poi scartati, per cui l'albero non li contiene più.
+    Se sink non è None, i risultati vengono passati a sink
+    (si veda create_result_json).
+
+    Con --parallel (e senza sink) i risultati vengono convertiti da un
+    pool di processi (si veda create_result_json_parallel).
+    """
+    streamed_results = None
+    backend = get_backend(args.get("backend"))
+    result_filter = get_result_filter(args)
+    to_stream = args.get("stream") and \
+        (args.get("all") or args.get("results"))
+    to_parallel = args.get("parallel") and sink is None and \
+        (args.get("all") or args.get("results"))
+
+    # I report compressi non consentono l'accesso diretto alle sezioni,
+    # per cui vengono sempre letti per intero
+    if (args.get("index") or to_parallel) and \
+            get_compression(input_file) is None:
+        # Con l'indice vengono lette ed interpretate soltanto le sezioni
+        # richieste, a partire dalla loro posizione nel file
+        sections = load_index(input_file)
+        general_tags, report_tags = \
+            get_section_tags([k for k, v in args.items() if v])
+        if to_stream or to_parallel:
+            report_tags.discard("results")
+        with open(input_file, "rb") as f:
+            general_report, report = build_partial_report(
+                f, sections, general_tags, report_tags, backend)
+            if to_parallel:
+                for byte_range in sections["report"].get("results", []):
+                    streamed_results = create_result_json_parallel(
+                        input_file, byte_range, args, args.get("workers"))
+                    report.append(backend.Element("results"))
+            elif to_stream:
+                for byte_range in sections["report"].get("results", []):
+                    context, result_nodes = backend.stream_results(
+                        SectionReader(f, *byte_range))
+                    streamed_results = create_result_json(
+                        result_nodes, RESULT_COLUMN_NAMES, sink,
+                        result_filter)
+                    report.append(context.root)
+        return general_report, report, streamed_results
+
+    if args.get("stream"):
+        with open_file(input_file, "rb") as f:
+            context, result_nodes = backend.stream_results(f)
+            if to_stream:
+                streamed_results = create_result_json(
+                    result_nodes, RESULT_COLUMN_NAMES, sink, result_filter)
+            else:
+                for _ in result_nodes:
+                    pass
+        root = context.root
+    else:
+        with open_file(input_file, "rb") as f:
+            root = backend.parse(f).getroot()
+
+    # Acquisizione dei nodi riguardanti il report generico e il report
+    general_report = root[get_indexes(root)["report"]]
+    report = general_report[get_indexes(general_report)["report"]]
+    return general_report, report, streamed_results
+
+
+def get_output_file_name(input_file, general_report, report,
+                         extension=".json"):
+    """
+    Computa e restituisce il nome del file di output, ottenuto dall'id
+    del task a cui fa riferimento il report
+    """
+    drnm = dirname(input_file)
+    task_id = report[get_indexes(report)["task"]].attrib.get("id")
+    return ("." if drnm == '' else drnm) + r"/" + task_id + extension
+
+
+def write_report_to_file(report, output_file, compact=False):
     """
-    Scrive nel file di output output_file il report passato come parametro
+    Scrive nel file di output output_file il report passato come parametro,
+    senza indentazione se compact è True. Il file viene compresso se il
+    nome ha l'estensione .gz o .xz.
+
+    Il report viene scritto in un file temporaneo, rinominato al termine:
+    più processi che scrivono lo stesso file di output (ad esempio report
+    dello stesso task) non ne mescolano quindi il contenuto.
     """
     print(f"Writing report to {output_file}.")
-    with open(output_file, "w") as f:
-        f.write(dumps(report, indent=4))
+    path = create_temp_file(dirname(output_file) or ".")
+    try:
+        with open_file(path, "w", get_compression(output_file)) as f:
+            write_report(f, report, None if compact else 4)
+    except BaseException:
+        finalize_temp_file(path)
+        raise
+    finalize_temp_file(path, output_file)
 
 
-# Parser degli argomenti in input e relativi parametri inseriti
-parser = get_parser()
-args = vars(parser.parse_args())
+def process_report(input_file, args):
+    """
+    Elabora un singolo report: lo legge, crea il report in formato json
+    secondo i parametri in input e lo scrive nel file di output.
 
-# Acquisizione del parametro riguardante il file di input
-input_file = args["input"]
+    Se il report è già stato elaborato con gli stessi parametri, il file
+    di output viene copiato dalla cache senza leggere il report (XML).
 
-# Lettura del file di input e acquisizione degli indici del nodo root (XML)
-# info(f"Reading {input_file}.")
-root = parse(input_file).getroot()
-root_indexes = get_indexes(root)
+    Restituisce il nome del file di output.
+    """
+    if args.get("no_cache") or args.get("profile"):
+        return write_output_file(input_file, args)
+
+    # La cache serve soltanto a velocizzare l'elaborazione: se non è
+    # utilizzabile (ad esempio la cartella non può essere creata) il
+    # report viene elaborato normalmente
+    cache_size = args.get("cache_size")
+    # Sono esclusi soltanto i parametri assenti: valori come
+    # --min-severity 0 modificano l'output e fanno parte della chiave
+    options = {k: args[k] for k in OUTPUT_OPTIONS
+               if args.get(k) is not None and args[k] is not False}
+    drnm = dirname(input_file)
+    try:
+        cache = ParseCache(args.get("cache_dir") or DEFAULT_CACHE_DIR,
+                           (512 if cache_size is None else cache_size)
+                           * 1024 * 1024)
+        key = get_cache_key(input_file, options)
+        output_file = cache.restore(key, "." if drnm == '' else drnm)
+    except OSError as e:
+        print(f"Cache not available, skipping it: {e}", file=stderr)
+        return write_output_file(input_file, args)
+    if output_file is not None:
+        print(f"Writing cached report to {output_file}.")
+        return output_file
+
+    output_file = write_output_file(input_file, args)
+    try:
+        cache.store(key, output_file, basename(output_file))
+    except OSError as e:
+        print(f"Could not store the report in the cache: {e}", file=stderr)
+    return output_file
+
+
+def parse_report(input_file, sections=("all",), **options) -> dict:
+    """
+    Legge il report (XML) e restituisce il dizionario del report in formato
+    json contenente le sezioni richieste (ad esempio ("results", "ports"),
+    con gli stessi nomi dei parametri a linea di comando), senza scrivere
+    alcun file e senza utilizzare la cache.
+
+    Le altre opzioni corrispondono ai parametri a linea di comando, ad
+    esempio backend="lxml", stream=True oppure min_severity=5.0; quelle
+    relative al formato del file di output vengono ignorate.
+    """
+    args = vars(get_parser().parse_args([f"--input={input_file}"]))
+    unknown = set(options) - set(args)
+    if unknown:
+        raise TypeError(f"Unknown options: {', '.join(sorted(unknown))}")
+    args.update(options)
+    for section in sections:
+        if section not in ("all", "owner", *REPORT_SECTION_TAGS):
+            raise ValueError(f"Unknown section: {section}")
+        args[section] = True
+    # I risultati convertiti in parallelo sono già serializzati
+    args["parallel"] = False
+
+    general_report, report, streamed_results = read_report(input_file, args)
+    return create_report_json(args, general_report, report,
+                              streamed_results)
+
+
+def write_output_file(input_file, args):
+    """
+    Legge il report e scrive il file di output secondo i parametri
+    in input.
 
-# Acquisizione del nodo riguardante il report generico e relativi indici
-general_report = root[root_indexes["report"]]
-general_report_indexes = get_indexes(general_report)
+    Se richiesto, ogni fase dell'elaborazione viene misurata e le misure
+    vengono stampate a schermo al termine.
+
+    Restituisce il nome del file di output.
+    """
+    profiler = Profiler() if args.get("profile") else None
+    try:
+        if args.get("stats") or args.get("format", "json") != "json":
+            return write_results_to_sink(input_file, args, profiler)
+        return write_json_file(input_file, args, profiler)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            print(profiler.to_json() if args["profile"] == "json"
+                  else profiler.to_table())
+
+
+def write_json_file(input_file, args, profiler=None):
+    """
+    Legge il report e scrive il report in formato json secondo i
+    parametri in input.
 
-# Acquisizione del nodo riguardante il report e relativi indici
-report = general_report[general_report_indexes["report"]]
-report_indexes = get_indexes(report)
+    Restituisce il nome del file di output.
+    """
+    # Con la scrittura incrementale i risultati vengono scritti su
+    # disco man mano che vengono prodotti, altrimenti possono essere
+    # mantenuti in memoria in forma compatta. Con le tabelle di nvt e
+    # descrizioni i risultati sono già compatti e non vengono internati.
+    # Anche con --stream i risultati vengono scritti su disco, altrimenti
+    # la memoria occupata crescerebbe comunque con il loro numero.
+    sink = None
+    if args.get("incremental") or \
+            (args.get("stream") and not args.get("parallel")):
+        sink = ResultSpool(None if args.get("compact") else 4)
+    elif args.get("interned") and not args.get("dedup"):
+        sink = RecordCollector(RESULT_COLUMN_NAMES)
+    if args.get("dedup"):
+        sink = TableEncoder(RESULT_COLUMN_NAMES, sink)
+    try:
+        with profile(profiler, "parse"):
+            general_report, report, streamed_results = \
+                read_report(input_file, args, sink)
+        json_report = create_report_json(args, general_report, report,
+                                         streamed_results, sink, profiler)
+        if args.get("dedup") and "results" in json_report:
+            json_report.update(sink.get_tables())
+        output_file = get_output_file_name(
+            input_file, general_report, report,
+            ".json" + get_compression_suffix(args.get("compress")))
+        with profile(profiler, "write"):
+            write_report_to_file(json_report, output_file,
+                                 args.get("compact"))
+    finally:
+        if sink is not None:
+            sink.close()
+    return output_file
+
+
+def write_results_to_sink(input_file, args, profiler=None):
+    """
+    Elabora un singolo report scrivendo soltanto i risultati, appiattiti,
+    nel formato di output richiesto (si veda result_sinks), oppure
+    soltanto le relative statistiche (si veda result_columns).
 
-# Creazione del report
-# info("Creating json report.")
-json_report = create_report_json(args)
+    Restituisce il nome del file di output.
+    """
+    args = dict(args, results=True)
+    drnm = dirname(input_file)
+    compression = args.get("compress")
+    if args.get("stats"):
+        sink = StatsSink("." if drnm == '' else drnm, RESULT_COLUMN_NAMES,
+                         compression)
+    else:
+        sink = SINKS[args["format"]]("." if drnm == '' else drnm,
+                                     compression)
+    output_file = None
+    try:
+        with profile(profiler, "parse"):
+            general_report, report, streamed_results = \
+                read_report(input_file, args, sink)
+        if streamed_results is None:
+            with profile(profiler, "results"):
+                results = report[get_indexes(report)["results"]]
+                create_result_json(results, RESULT_COLUMN_NAMES, sink,
+                                   get_result_filter(args))
+        output_file = get_output_file_name(
+            input_file, general_report, report,
+            sink.extension + get_compression_suffix(compression))
+        print(f"Writing results to {output_file}.")
+    finally:
+        with profile(profiler, "write"):
+            sink.close(output_file)
+    if args.get("stats"):
+        print_statistics(sink.statistics)
+    return output_file
+
+
+def process_reports(input_files, args, max_workers=None):
+    """
+    Elabora in parallelo i report passati come parametro, distribuendoli
+    su un pool di processi.
 
-# Computazione del nome del file di output
-dir = dirname(input_file)
-output_file = ("." if dir == '' else dir) + r"/" + \
-              create_report_json({"tasks": True})["task"]["id"] + ".json"
+    Il numero di report in elaborazione contemporaneamente è limitato al
+    doppio del numero di processi, così da non accodare l'intero elenco.
 
-# Scrittura all'interno del file di output
-write_report_to_file(json_report, output_file)
+    Restituisce un dizionario contenente, per ogni report, il nome del
+    file di output oppure l'eccezione sollevata durante l'elaborazione.
+    """
+    max_workers = max_workers or cpu_count()
+    outcome = {}
+    pending = {}
+    files = iter(input_files)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # Riempi la finestra dei report in elaborazione
+            for input_file in files:
+                pending[executor.submit(process_report,
+                                        input_file, args)] = input_file
+                if len(pending) >= 2 * max_workers:
+                    break
+            if not pending:
+                break
+
+            # Attendi il completamento di almeno un report
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                input_file = pending.pop(future)
+                try:
+                    outcome[input_file] = future.result()
+                except Exception as e:
+                    print(f"Error while processing {input_file}: {e}",
+                          file=stderr)
+                    outcome[input_file] = e
+
+    return outcome
+
+
+def get_input_files(input_dir, pattern):
+    """
+    Restituisce la lista ordinata dei report presenti nella cartella
+    input_dir il cui nome corrisponde al pattern (glob) in input
+    """
+    return sorted(glob(join(input_dir, pattern)))
+
+
+def get_duplicate_outputs(outcome) -> dict:
+    """
+    Restituisce un dizionario contenente, per ogni file di output prodotto
+    da più report (ad esempio più report dello stesso task), la lista
+    ordinata dei relativi report: il file contiene soltanto l'ultimo
+    report scritto
+    """
+    reports = {}
+    for input_file, output_file in outcome.items():
+        if not isinstance(output_file, Exception):
+            reports.setdefault(output_file, []).append(input_file)
+    return {k: sorted(v) for k, v in reports.items() if len(v) > 1}
+
+
+def print_summary(outcome, elapsed):
+    """
+    Stampa a schermo un riepilogo dell'elaborazione di più report
+    """
+    failed = [k for k, v in outcome.items() if isinstance(v, Exception)]
+    duplicates = get_duplicate_outputs(outcome)
+    overwritten = sum(len(v) - 1 for v in duplicates.values())
+    print(f"Processed {len(outcome)} reports in {elapsed:.2f}s: "
+          f"{len(outcome) - len(failed) - overwritten} written, "
+          f"{overwritten} overwritten, {len(failed)} failed.")
+    for output_file, input_files in sorted(duplicates.items()):
+        print(f"Overwritten: {output_file} was written by "
+              f"{', '.join(input_files)}")
+    for input_file in failed:
+        print(f"Failed: {input_file}")
+
+
+def main():
+    """
+    Main function.
+    """
+    parser = get_parser()
+    args = vars(parser.parse_args())
+    if args["compress"] and args["format"] == "sqlite" and not args["stats"]:
+        parser.error("--compress is not supported with --format sqlite")
+
+    if args["input"]:
+        process_report(args["input"], args)
+        return
+
+    # Elaborazione di tutti i report contenuti nella cartella in input
+    input_files = get_input_files(args["input_dir"], args["pattern"])
+    start = perf_counter()
+    outcome = process_reports(input_files, args, args["workers"])
+    print_summary(outcome, perf_counter() - start)
+    # Codice di uscita non nullo se almeno un report non è stato elaborato
+    if any(isinstance(v, Exception) for v in outcome.values()):
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()